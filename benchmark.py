@@ -0,0 +1,431 @@
+"""
+Offline benchmark harness for the weather MCP server.
+
+Starts local stand-ins for the Open-Meteo forecast/archive APIs and Nominatim (in a separate process, so their
+memory does not count against the server), points server.py at them and drives the tool functions at controlled
+concurrency. Reports throughput, p50/p95/p99 latency, peak RSS and upstream call counts per scenario.
+
+Usage:
+    python benchmark.py                                   # run every scenario
+    python benchmark.py --scenario burst --concurrency 128
+    python benchmark.py --latency-ms 80 --error-rate 0.02
+    python benchmark.py --json results.json               # save the report
+    python benchmark.py --baseline results.json           # fail (exit 1) on regressions against a saved report
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+import zlib
+from datetime import date, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+from aiohttp import web
+
+import server
+
+# ----------------------------------------------------------------------------------------------------------------------
+# CONFIGURATION
+# ----------------------------------------------------------------------------------------------------------------------
+
+SCENARIOS = (
+    "forecast_cold", "forecast_warm", "geocode_cold", "geocode_warm",
+    "history_multi_year", "history_extend", "batch_forecast", "burst", "dense_sites"
+)
+
+# Scheduler limits used against the stand-ins unless --production-limits is given: high enough that the
+# benchmark measures the server, not the politeness limits
+RELAXED_LIMITS: Tuple[float, int, int] = (10_000.0, 1_000, 64)
+
+# ----------------------------------------------------------------------------------------------------------------------
+# UPSTREAM STAND-INS
+# ----------------------------------------------------------------------------------------------------------------------
+
+def _days(start: date, end: date) -> List[date]:
+    return [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+
+
+def _location_payload(lat: float, lon: float, start: date, end: date, query: Dict[str, str]) -> Dict[str, Any]:
+    payload: Dict[str, Any] = {
+        "latitude": lat, "longitude": lon, "generationtime_ms": 0.1, "utc_offset_seconds": 0,
+        "timezone": "GMT", "timezone_abbreviation": "GMT", "elevation": 250.0,
+    }
+    days = _days(start, end)
+    blocks = {
+        "minutely_15": [f"{day}T{minute // 60:02d}:{minute % 60:02d}" for day in days for minute in range(0, 1440, 15)],
+        "hourly": [f"{day}T{hour:02d}:00" for day in days for hour in range(24)],
+        "daily": [day.isoformat() for day in days],
+    }
+    for block, times in blocks.items():
+        if block not in query:
+            continue
+        variables = [name for name in query[block].split(",") if name]
+        payload[f"{block}_units"] = {"time": "iso8601", **{name: "unit" for name in variables}}
+        columns: Dict[str, List[Any]] = {"time": times}
+        for index, name in enumerate(variables):
+            if name in ("sunrise", "sunset"):
+                columns[name] = [f"{t}T06:00" if name == "sunrise" else f"{t}T18:00" for t in times]
+            else:
+                columns[name] = [round(10 + 10 * math.sin(i / 24 + lat + index), 1) for i in range(len(times))]
+        payload[block] = columns
+    return payload
+
+
+def _mock_app(kind: str, counters: Dict[str, int], latency: float, jitter: float, error_rate: float) -> web.Application:
+    async def delay_or_fail() -> Optional[web.Response]:
+        counters[kind] = counters.get(kind, 0) + 1
+        await asyncio.sleep(max(0.0, random.gauss(latency, jitter)))
+        if random.random() < error_rate:
+            counters[f"{kind}_errors"] = counters.get(f"{kind}_errors", 0) + 1
+            return web.Response(status=503, text="Service unavailable (injected)")
+        return None
+
+    async def weather(request: web.Request) -> web.Response:
+        failure = await delay_or_fail()
+        if failure is not None:
+            return failure
+        query = dict(request.query)
+        if kind == "archive":
+            start, end = date.fromisoformat(query["start_date"]), date.fromisoformat(query["end_date"])
+        else:
+            start = date.today() - timedelta(days=int(query.get("past_days", 0)))
+            end = date.today() + timedelta(days=max(int(query.get("forecast_days", 7)), 1) - 1)
+        lats = [float(value) for value in query["latitude"].split(",")]
+        lons = [float(value) for value in query["longitude"].split(",")]
+        payloads = [_location_payload(lat, lon, start, end, query) for lat, lon in zip(lats, lons)]
+        return web.json_response(payloads if len(payloads) > 1 else payloads[0])
+
+    async def search(request: web.Request) -> web.Response:
+        failure = await delay_or_fail()
+        if failure is not None:
+            return failure
+        place = request.query.get("q", "")
+        if "nowhere" in place.lower():
+            return web.json_response([])
+        seed = zlib.crc32(place.lower().encode())
+        lat, lon = (seed % 17000) / 100 - 85, ((seed // 17000) % 36000) / 100 - 180
+        return web.json_response([{
+            "place_id": seed, "lat": str(lat), "lon": str(lon), "display_name": place,
+            "boundingbox": [str(lat - 0.1), str(lat + 0.1), str(lon - 0.1), str(lon + 0.1)],
+        }])
+
+    async def stats(_: web.Request) -> web.Response:
+        return web.json_response(counters)
+
+    async def reset(_: web.Request) -> web.Response:
+        counters.clear()
+        return web.json_response({})
+
+    app = web.Application()
+    app.router.add_get("/search", search)
+    app.router.add_get("/v1/forecast", weather)
+    app.router.add_get("/v1/archive", weather)
+    app.router.add_get("/_stats", stats)
+    app.router.add_post("/_reset", reset)
+    return app
+
+
+def _serve_mocks(ports: "multiprocessing.Queue", latency: float, jitter: float, error_rate: float) -> None:
+    async def main() -> None:
+        counters: Dict[str, int] = {}
+        bound: Dict[str, int] = {}
+        for kind in ("forecast", "archive", "search"):
+            runner = web.AppRunner(_mock_app(kind, counters, latency, jitter, error_rate), access_log=None)
+            await runner.setup()
+            site = web.TCPSite(runner, "127.0.0.1", 0)
+            await site.start()
+            bound[kind] = site._server.sockets[0].getsockname()[1]
+        ports.put(bound)
+        await asyncio.Event().wait()
+
+    asyncio.run(main())
+
+
+class MockUpstreams:
+    """
+    Runs the three stand-ins in a child process and exposes their per-endpoint call counters.
+    """
+
+    def __init__(self, latency_ms: float, jitter_ms: float, error_rate: float):
+        self._args = (latency_ms / 1000, jitter_ms / 1000, error_rate)
+        self._process: Optional[multiprocessing.Process] = None
+        self.ports: Dict[str, int] = {}
+
+    def __enter__(self) -> "MockUpstreams":
+        ports: "multiprocessing.Queue" = multiprocessing.Queue()
+        self._process = multiprocessing.Process(target=_serve_mocks, args=(ports, *self._args), daemon=True)
+        self._process.start()
+        self.ports = ports.get(timeout=30)
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        if self._process is not None:
+            self._process.terminate()
+            self._process.join()
+
+    async def counters(self) -> Dict[str, int]:
+        async with httpx.AsyncClient() as http:
+            return (await http.get(f"http://127.0.0.1:{self.ports['forecast']}/_stats")).json()
+
+    async def reset(self) -> None:
+        async with httpx.AsyncClient() as http:
+            await http.post(f"http://127.0.0.1:{self.ports['forecast']}/_reset")
+
+# ----------------------------------------------------------------------------------------------------------------------
+# SERVER SETUP & MEASUREMENT
+# ----------------------------------------------------------------------------------------------------------------------
+
+async def reset_server(mocks: MockUpstreams, workdir: str, production_limits: bool) -> None:
+    """
+    Point server.py at the stand-ins and give it cold caches, a fresh store and fresh counters.
+    """
+    await server.close_http_client()
+    await server.close_geocoder()
+    server.GEOCODE_CACHE.close()
+    server.WEATHER_STORE.close()
+
+    netlocs = {kind: f"127.0.0.1:{port}" for kind, port in mocks.ports.items()}
+    server.FORECAST_API_BASE = f"http://{netlocs['forecast']}/v1/forecast"
+    server.HISTORY_API_BASE = f"http://{netlocs['archive']}/v1/archive"
+    server.NOMINATIM_DOMAIN = netlocs["search"]
+    server.NOMINATIM_SCHEME = "http"
+    if production_limits:
+        limits = {
+            netlocs["search"]: server.HOST_LIMITS["nominatim.openstreetmap.org"],
+            netlocs["forecast"]: server.HOST_LIMITS["api.open-meteo.com"],
+            netlocs["archive"]: server.HOST_LIMITS["archive-api.open-meteo.com"],
+        }
+    else:
+        limits = {netloc: RELAXED_LIMITS for netloc in netlocs.values()}
+    server.SCHEDULER = server.RequestScheduler(limits)
+
+    run_dir = tempfile.mkdtemp(dir=workdir)
+    server.GEOCODE_CACHE = server.GeocodeCache(path=os.path.join(run_dir, "geocode.sqlite3"))
+    server.WEATHER_STORE = server.WeatherStore(path=os.path.join(run_dir, "weather_store.sqlite3"))
+    server.RESPONSE_CACHE = server.ResponseCache()
+    server.OUTPUT_DIR = os.path.join(run_dir, "outputs")
+    server.METRICS = server.Metrics()
+    server.GRID_INDEXES = {dataset: server.GridIndex(res) for dataset, res in server.GRID_RESOLUTION.items()}
+    for counter in (server.API_CALLS, server.CACHE_STATS):
+        for name in counter:
+            counter[name] = 0
+    await mocks.reset()
+
+
+def current_rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS; it is a process-lifetime peak
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+
+async def drive(calls: List[Callable[[], Awaitable[Dict[str, Any]]]], concurrency: int) -> Dict[str, Any]:
+    """
+    Run the calls with at most `concurrency` in flight; returns latency, throughput, error and RSS figures.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors = 0
+    peak_rss = current_rss_mb()
+    done = asyncio.Event()
+
+    async def sample_rss() -> None:
+        nonlocal peak_rss
+        while not done.is_set():
+            peak_rss = max(peak_rss, current_rss_mb())
+            await asyncio.sleep(0.02)
+
+    async def run(call: Callable[[], Awaitable[Dict[str, Any]]]) -> None:
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            result = await call()
+            latencies.append(time.perf_counter() - started)
+            if result.get("status") == "error":
+                errors += 1
+
+    sampler = asyncio.create_task(sample_rss())
+    started = time.perf_counter()
+    await asyncio.gather(*(run(call) for call in calls))
+    duration = time.perf_counter() - started
+    done.set()
+    await sampler
+
+    latencies.sort()
+
+    def percentile(q: float) -> float:
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000 if latencies else 0.0
+
+    return {
+        "requests": len(calls), "errors": errors, "duration_s": round(duration, 3),
+        "throughput_rps": round(len(calls) / duration, 1) if duration else 0.0,
+        "p50_ms": round(percentile(0.50), 2), "p95_ms": round(percentile(0.95), 2), "p99_ms": round(percentile(0.99), 2),
+        "peak_rss_mb": round(peak_rss, 1),
+    }
+
+# ----------------------------------------------------------------------------------------------------------------------
+# SCENARIOS
+# ----------------------------------------------------------------------------------------------------------------------
+
+def _coords(count: int, seed: int = 0) -> List[Tuple[float, float]]:
+    rng = random.Random(seed)
+    return [(round(rng.uniform(35, 70), 4), round(rng.uniform(-10, 40), 4)) for _ in range(count)]
+
+
+def build_scenario(name: str, requests: int) -> Tuple[List[Callable[[], Awaitable[Dict[str, Any]]]], List[Callable[[], Awaitable[Dict[str, Any]]]]]:
+    """
+    Returns (warm-up calls, measured calls) for a scenario.
+    """
+    if name == "forecast_cold":
+        return [], [lambda lat=lat, lon=lon: server.get_forecast(latitude=lat, longitude=lon) for lat, lon in _coords(requests)]
+    if name == "forecast_warm":
+        hot = _coords(10)
+        warmup = [lambda lat=lat, lon=lon: server.get_forecast(latitude=lat, longitude=lon) for lat, lon in hot]
+        return warmup, [lambda lat=lat, lon=lon: server.get_forecast(latitude=lat, longitude=lon)
+                        for lat, lon in (hot[i % len(hot)] for i in range(requests))]
+    if name == "geocode_cold":
+        return [], [lambda i=i: server.get_forecast(place=f"Benchmark Town {i}") for i in range(requests)]
+    if name == "geocode_warm":
+        places = [f"Benchmark City {i}" for i in range(10)]
+        warmup = [lambda place=place: server.get_forecast(place=place) for place in places]
+        return warmup, [lambda place=places[i % len(places)]: server.get_forecast(place=place) for i in range(requests)]
+    if name == "history_multi_year":
+        end = date(date.today().year - 1, 12, 31)
+        start = date(end.year - 2, 1, 1)
+        return [], [lambda lat=lat, lon=lon: server.get_history(
+            latitude=lat, longitude=lon, start_date=start.isoformat(), end_date=end.isoformat()
+        ) for lat, lon in _coords(max(1, requests // 25))]
+    if name == "history_extend":
+        # Backfill a year, then ask for the same ranges shifted by a month: only the new month should be fetched
+        end = date(date.today().year - 1, 11, 30)
+        start = date(end.year, 1, 1)
+        sites = _coords(max(1, requests // 10))
+        warmup = [lambda lat=lat, lon=lon: server.get_history(
+            latitude=lat, longitude=lon, start_date=start.isoformat(), end_date=end.isoformat()
+        ) for lat, lon in sites]
+        return warmup, [lambda lat=lat, lon=lon: server.get_history(
+            latitude=lat, longitude=lon, start_date=(start + timedelta(days=31)).isoformat(),
+            end_date=(end + timedelta(days=31)).isoformat()
+        ) for lat, lon in sites]
+    if name == "batch_forecast":
+        sites = _coords(500, seed=1)
+        return [], [lambda: server.get_forecast_batch(
+            latitudes=[lat for lat, _ in sites], longitudes=[lon for _, lon in sites]
+        ) for _ in range(max(1, requests // 100))]
+    if name == "burst":
+        hot = _coords(20, seed=2)
+        calls: List[Callable[[], Awaitable[Dict[str, Any]]]] = []
+        for i in range(requests):
+            lat, lon = hot[i % len(hot)] if i % 2 else _coords(1, seed=1000 + i)[0]
+            calls.append(lambda lat=lat, lon=lon: server.get_forecast(latitude=lat, longitude=lon, variables="temperature_2m"))
+        return [], calls
+    if name == "dense_sites":
+        # A dense sensor network: sites a few hundred meters around 20 centers, as the spatial index sees them
+        rng = random.Random(3)
+        centers = _coords(20, seed=3)
+        sites = [(lat + rng.uniform(-0.002, 0.002), lon + rng.uniform(-0.002, 0.002))
+                 for lat, lon in (centers[i % len(centers)] for i in range(requests))]
+        return [], [lambda lat=lat, lon=lon: server.get_forecast(latitude=lat, longitude=lon) for lat, lon in sites]
+    raise ValueError(f"Unknown scenario: {name}")
+
+
+async def run_scenarios(args: argparse.Namespace, mocks: MockUpstreams) -> Dict[str, Dict[str, Any]]:
+    report: Dict[str, Dict[str, Any]] = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for name in args.scenario or SCENARIOS:
+            await reset_server(mocks, workdir, args.production_limits)
+            warmup, calls = build_scenario(name, args.requests)
+            if warmup:
+                await drive(warmup, args.concurrency)
+                # Let background work started by the warmup (e.g. archive store writes) finish before measuring
+                if server._BACKGROUND_TASKS:
+                    await asyncio.wait(list(server._BACKGROUND_TASKS))
+                await mocks.reset()
+                for counter in (server.API_CALLS, server.CACHE_STATS):
+                    for key in counter:
+                        counter[key] = 0
+            result = await drive(calls, args.concurrency)
+            counters = await mocks.counters()
+            result["upstream_calls"] = {k: v for k, v in counters.items() if not k.endswith("_errors")}
+            result["upstream_errors"] = {k: v for k, v in counters.items() if k.endswith("_errors")}
+            result["cache"] = dict(server.CACHE_STATS)
+            report[name] = result
+            print(f"{name:<20} {result['requests']:>6} req  {result['throughput_rps']:>9.1f} req/s  "
+                  f"p50 {result['p50_ms']:>8.2f} ms  p95 {result['p95_ms']:>8.2f} ms  p99 {result['p99_ms']:>8.2f} ms  "
+                  f"rss {result['peak_rss_mb']:>7.1f} MB  upstream {result['upstream_calls']}  errors {result['errors']}")
+    await server.close_http_client()
+    await server.close_geocoder()
+    return report
+
+
+def find_regressions(report: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]], tolerance: float) -> List[str]:
+    """
+    Throughput drops, p95 increases and upstream call increases beyond `tolerance` (a fraction) against a saved report.
+    """
+    problems: List[str] = []
+    for name, result in report.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if result["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            problems.append(f"{name}: throughput {result['throughput_rps']} < baseline {base['throughput_rps']}")
+        if result["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            problems.append(f"{name}: p95 {result['p95_ms']} ms > baseline {base['p95_ms']} ms")
+        calls, base_calls = sum(result["upstream_calls"].values()), sum(base["upstream_calls"].values())
+        if calls > base_calls * (1 + tolerance):
+            problems.append(f"{name}: {calls} upstream calls > baseline {base_calls}")
+    return problems
+
+# ----------------------------------------------------------------------------------------------------------------------
+# MAIN ENTRYPOINT
+# ----------------------------------------------------------------------------------------------------------------------
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Offline benchmark for the weather MCP server tools.")
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS, help="Scenario to run (repeatable; default: all).")
+    parser.add_argument("--requests", type=int, default=200, help="Measured tool calls per scenario (scaled down for heavy scenarios).")
+    parser.add_argument("--concurrency", type=int, default=32, help="Tool calls in flight at once.")
+    parser.add_argument("--latency-ms", type=float, default=40.0, help="Mean stand-in response latency.")
+    parser.add_argument("--jitter-ms", type=float, default=10.0, help="Standard deviation of the stand-in latency.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of stand-in responses that fail with HTTP 503.")
+    parser.add_argument("--production-limits", action="store_true", help="Apply the real per-host rate limits to the stand-ins.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the benchmark's own randomness.")
+    parser.add_argument("--json", help="Write the report to this file.")
+    parser.add_argument("--baseline", help="Compare against a report written with --json; exit 1 on regressions.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression against --baseline.")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    for name in (None, server.__name__, "httpx"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    with MockUpstreams(args.latency_ms, args.jitter_ms, args.error_rate) as mocks:
+        report = asyncio.run(run_scenarios(args, mocks))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            problems = find_regressions(report, json.load(f), args.tolerance)
+        for problem in problems:
+            print(f"REGRESSION {problem}")
+        return 1 if problems else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
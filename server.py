@@ -1,145 +1,2884 @@
+import argparse
 import asyncio
+import contextvars
+import functools
+import importlib.util
+import json
 import logging
-from typing import Any, Dict, Optional, Tuple, Annotated, List
-from datetime import datetime, date, timedelta
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, Optional, Sequence, Tuple, Annotated, List
+from datetime import datetime, date, timedelta, timezone
+from urllib.parse import urlencode, urlsplit
 
 import httpx
+import uvicorn
 from geopy.geocoders import Nominatim
 from geopy.adapters import AioHTTPAdapter
-from geopy.extra.rate_limiter import AsyncRateLimiter
+from geopy.geocoders.base import Geocoder
 from pydantic import BaseModel, ValidationError, Field
 from mcp.server.fastmcp import FastMCP
+# Private helper used by WeatherMCP.call_tool; requirements.txt pins mcp to the version this was written against
+from mcp.server.fastmcp.server import _convert_to_content
+from starlette.applications import Starlette
+
+# Optional dependencies, only needed for the columnar output formats, resampling and the streaming transport
+try:
+    import numpy as np
+except ImportError:
+    np = None
+try:
+    import ijson
+except ImportError:
+    ijson = None
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
 
 # ----------------------------------------------------------------------------------------------------------------------
 # CONFIGURATION & INITIALIZATION
 # ----------------------------------------------------------------------------------------------------------------------
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(name)s: %(message)s"
-)
-logger = logging.getLogger(__name__)
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(name)s: %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+# API endpoints
+FORECAST_API_BASE = "https://api.open-meteo.com/v1/forecast"
+HISTORY_API_BASE = "https://archive-api.open-meteo.com/v1/archive"
+NOMINATIM_DOMAIN = "nominatim.openstreetmap.org"
+NOMINATIM_SCHEME = "https"
+
+# Defaults
+TIMEZONE = "auto"
+DEFAULT_TIMEOUT = 30.0  
+DEFAULT_FORECAST_DAYS = 7
+DEFAULT_PAST_DAYS = 0
+
+# Geocoding cache (in-memory LRU in front of an on-disk SQLite tier)
+GEOCODE_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "geocode.sqlite3")
+GEOCODE_CACHE_TTL = 30 * 24 * 3600  # seconds; place names rarely move
+GEOCODE_MEMORY_SIZE = 1024          # entries kept in the in-memory LRU tier
+GEOCODE_DISK_MAX_ENTRIES = 100_000  # entries kept in the SQLite tier before evicting the oldest
+
+# Response cache for fetch_json
+RESPONSE_CACHE_MAX_ENTRIES = 2048
+FORECAST_UPDATE_INTERVAL = 3600       # seconds between Open-Meteo forecast model updates
+FORECAST_UPDATE_DELAY = 10 * 60       # seconds after each update before new data is reliably served
+ARCHIVE_SETTLE_DAYS = 7               # archive days older than this are final and kept in WEATHER_STORE
+ARCHIVE_RECENT_CACHE_TTL = 6 * 3600   # TTL for archive ranges that touch the last ARCHIVE_SETTLE_DAYS
+ARCHIVE_MEMORY_TTL = 3600             # settled archive months stay this long in RESPONSE_CACHE; WEATHER_STORE
+                                      # answers later repeats (an hourly month is ~0.4 MB as Python objects)
+STALE_WHILE_REVALIDATE = False        # serve expired forecasts immediately and refresh them in the background
+STALE_MAX_AGE = 6 * 3600              # oldest expired entry that may still be served in that mode
+
+# Local archive store (SQLite), written through by get_history for archive months that are final
+STORE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "weather_store.sqlite3")
+STORE_COORD_PRECISION = 3  # decimal places of latitude/longitude used to key stored locations (~100 m)
+STORE_SCHEMA_VERSION = 1   # bumped when the store layout changes; older stores are emptied and refilled
+
+# Spatial index: request coordinates are snapped to a regular lat/lon lattice per dataset, so nearby sites share
+# upstream calls, cache entries, stored archive data and prefetched data. Open-Meteo answers from the nearest model
+# grid cell anyway, but applies its elevation downscaling (90 m DEM) at the requested point, so snapping moves the
+# answer: 0.01 deg shifts a site by at most ~0.8 km. Archive snapping is off by default; setting it to 0.1 (the
+# ERA5-Land grid) shares far more data between sites but moves them by up to ~7.8 km. 0 disables snapping.
+# Responses report both the requested and the snapped coordinate.
+GRID_RESOLUTION: Dict[str, float] = {"forecast": 0.01, "history": 0.0}
+GRID_INDEX_MAX_CELLS = 100_000  # cells remembered per dataset for the hit-rate statistics
+
+# Chunked archive fetching for get_history
+HISTORY_CHUNK_CONCURRENCY = 4  # chunks of one get_history call fetched in parallel
+HISTORY_WHOLE_MONTH_FRACTION = 0.5  # a month is fetched whole once a request covers this fraction of it
+PACKET_RETRIES = 2             # extra attempts for an upstream request that failed with HTTP 429/5xx
+
+# Multi-location batch tools
+BATCH_MAX_SITES = 1000         # locations accepted by one batch tool call
+BATCH_MAX_LOCATIONS = 100      # locations packed into one comma-separated upstream request
+
+# Columnar output (output_format other than "json")
+OUTPUT_FORMATS = ("json", "numpy", "arrow", "parquet")
+OUTPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "outputs")
+OUTPUT_INLINE_MAX_VALUES = 20_000  # numpy results up to this many values are returned inline instead of as a file
+OUTPUT_MAX_AGE = 24 * 3600         # output files older than this are deleted
+
+# Server-side resampling (`resample`/`aggregate` tool parameters)
+AGGREGATE_REDUCERS = ("mean", "min", "max", "sum", "count")  # percentiles are written as "pNN", e.g. "p95"
+AGGREGATE_CACHE_MAX_ENTRIES = 20_000  # cached (location, month, variable, interval) partial aggregates
+
+# Background prefetching of watched locations (see WatchEntry for the watch list format)
+WATCHLIST_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "watchlist.json")
+PREFETCH_CONCURRENCY = 4       # watch list request groups refreshed in parallel
+PREFETCH_JITTER = 120          # seconds; random delay spreading refreshes after each model update
+PREFETCH_ARCHIVE_HOUR_UTC = 2  # hour of the nightly archive backfill
+PREFETCH_ARCHIVE_DAYS = 14     # minimum trailing settled days covered by the nightly archive backfill
+PREFETCH_LEASE_TTL = 60.0      # seconds; with several workers only the holder of this lease prefetches
+
+# Outbound request scheduling per upstream host (host:port for non-default ports):
+# (requests per second, burst size, max in-flight requests).
+# Nominatim's usage policy allows at most 1 request per second.
+HOST_LIMITS: Dict[str, Tuple[float, int, int]] = {
+    NOMINATIM_DOMAIN: (1 / 1.1, 1, 1),
+    "api.open-meteo.com": (10.0, 10, 8),
+    "archive-api.open-meteo.com": (5.0, 5, 4),
+}
+DEFAULT_HOST_LIMITS: Tuple[float, int, int] = (5.0, 5, 4)
+
+# Counter for monitoring usage
+API_CALLS: Dict[str, int] = {"geocoding": 0, "forecast": 0, "history": 0}
+CACHE_STATS: Dict[str, int] = {
+    "geocoding_hits": 0, "geocoding_misses": 0, "geocoding_coalesced": 0,
+    "response_hits": 0, "response_misses": 0, "response_stale": 0, "response_coalesced": 0,
+    "store_hits": 0, "store_misses": 0,
+    "aggregate_hits": 0, "aggregate_misses": 0
+}
+
+# Observability
+LOG_SAMPLE_RATE = 0.1  # fraction of per-request log lines emitted (when their level is enabled)
+
+# Shared HTTP client (created and closed by the server lifespan, see HTTP CLIENT)
+HTTP_MAX_CONNECTIONS = 64        # total connections across all upstream hosts
+HTTP_MAX_KEEPALIVE = 32          # idle connections kept open for reuse
+HTTP_KEEPALIVE_EXPIRY = 60.0     # seconds an idle connection is kept
+HTTP2_ENABLED = True             # multiplex requests to the Open-Meteo hosts over HTTP/2 (needs the h2 package)
+
+# Network transport (--transport streamable-http/sse) and multi-worker mode
+HTTP_HOST = "127.0.0.1"
+HTTP_PORT = 8000
+HTTP_WORKERS = 1
+DRAIN_TIMEOUT = 30.0  # seconds shutdown waits for in-flight tool calls before releasing resources
+# With several workers the response cache gets a shared SQLite tier, and the per-host token buckets live in a
+# separate small file so that bulky cache writes never hold up rate limiting (the geocode cache and the archive
+# store are SQLite files already). The parent process sets SHARED_STATE_ENV to "1" to enable this in its workers.
+SHARED_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "shared_cache.sqlite3")
+SHARED_COORDINATION_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "shared_coordination.sqlite3")
+SHARED_STATE_ENV = "WEATHER_MCP_SHARED_STATE"
+SHARED_CACHE_MAX_ENTRIES = 50_000  # responses kept in the shared SQLite tier before evicting the oldest
+
+# ----------------------------------------------------------------------------------------------------------------------
+# DATA MODELS & VALIDATION
+# ----------------------------------------------------------------------------------------------------------------------
+
+class Coordinate(BaseModel):
+    """
+    Model: Geographic coordinates validator
+    """
+    latitude: Annotated[float, Field(ge=-90.0, le=90.0)]
+    longitude: Annotated[float, Field(ge=-180.0, le=180.0)]
+
+
+class WatchEntry(BaseModel):
+    """
+    Model: Watch list entry kept warm by the prefetcher (fields mirror the get_forecast/get_history parameters)
+    """
+    place: Optional[str] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    granularity: int = 60
+    forecast_days: Optional[int] = DEFAULT_FORECAST_DAYS
+    past_days: Optional[int] = DEFAULT_PAST_DAYS
+    variables: Optional[str] = None
+    daily_variables: Optional[str] = None
+    archive: bool = True  # also append new archive days for this entry every night
+
+# ----------------------------------------------------------------------------------------------------------------------
+# OBSERVABILITY
+# ----------------------------------------------------------------------------------------------------------------------
+
+# Name of the MCP tool the current task is serving; "background" for prefetching and other internal work
+_CURRENT_TOOL: contextvars.ContextVar[str] = contextvars.ContextVar("current_tool", default="background")
+
+
+def log_sampled(level: int, msg: str, *args: Any) -> None:
+    """
+    Per-request logging: formatted lazily and only for a LOG_SAMPLE_RATE sample, so it costs nothing when disabled.
+    """
+    if logger.isEnabledFor(level) and random.random() < LOG_SAMPLE_RATE:
+        logger.log(level, msg, *args)
+
+
+class LatencyHistogram:
+    """
+    Fixed-bucket latency histogram (seconds), compatible with Prometheus bucket semantics.
+    """
+    BUCKETS: Tuple[float, ...] = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+    __slots__ = ("counts", "count", "total")
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKETS) + 1)  # last slot is +Inf
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect_left(self.BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+
+    def quantile(self, q: float) -> float:
+        """
+        Upper bound of the bucket containing the q-quantile.
+        """
+        rank = q * self.count
+        cumulative = 0
+        for index, bucket_count in enumerate(self.counts):
+            cumulative += bucket_count
+            if cumulative >= rank and bucket_count:
+                return self.BUCKETS[index] if index < len(self.BUCKETS) else float("inf")
+        return 0.0
+
+    def snapshot(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.quantile(0.50),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+        }
+
+
+class Metrics:
+    """
+    Stage latency histograms per tool and per upstream host, plus event counters.
+    Stages: geocode, build_params, upstream_queue, upstream, json_decode, serialize (columnar formats), encode
+    (the MCP text content of the result), total.
+    """
+
+    def __init__(self):
+        self.histograms: Dict[Tuple[str, str, str], LatencyHistogram] = {}
+        self.counters: Dict[str, int] = {
+            "retries": 0, "timeouts": 0, "network_errors": 0, "http_errors": 0, "tool_errors": 0
+        }
+
+    def _observe(self, scope: str, name: str, stage: str, seconds: float) -> None:
+        histogram = self.histograms.get((scope, name, stage))
+        if histogram is None:
+            histogram = self.histograms[(scope, name, stage)] = LatencyHistogram()
+        histogram.observe(seconds)
+
+    def observe(self, stage: str, seconds: float, upstream: Optional[str] = None) -> None:
+        self._observe("tool", _CURRENT_TOOL.get(), stage, seconds)
+        if upstream is not None:
+            self._observe("upstream", upstream, stage, seconds)
+
+    @contextmanager
+    def timed(self, stage: str, upstream: Optional[str] = None) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started, upstream)
+
+    def count(self, name: str, amount: int = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def snapshot(self) -> Dict[str, Dict[str, Dict[str, Dict[str, float]]]]:
+        result: Dict[str, Dict[str, Dict[str, Dict[str, float]]]] = {"tool": {}, "upstream": {}}
+        for (scope, name, stage), histogram in sorted(self.histograms.items()):
+            result[scope].setdefault(name, {})[stage] = histogram.snapshot()
+        return result
+
+    def openmetrics(self, gauges: Dict[str, Dict[str, float]]) -> str:
+        """
+        OpenMetrics/Prometheus text exposition of the histograms, counters and the given gauge families.
+        """
+        lines = ["# TYPE weather_stage_latency_seconds histogram"]
+        for (scope, name, stage), histogram in sorted(self.histograms.items()):
+            labels = f'scope="{scope}",name="{name}",stage="{stage}"'
+            cumulative = 0
+            for bound, bucket_count in zip(list(LatencyHistogram.BUCKETS) + ["+Inf"], histogram.counts):
+                cumulative += bucket_count
+                lines.append(f'weather_stage_latency_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"weather_stage_latency_seconds_sum{{{labels}}} {histogram.total}")
+            lines.append(f"weather_stage_latency_seconds_count{{{labels}}} {histogram.count}")
+        lines.append("# TYPE weather_events counter")
+        for name, value in sorted(self.counters.items()):
+            lines.append(f'weather_events_total{{event="{name}"}} {value}')
+        for family, values in gauges.items():
+            lines.append(f"# TYPE weather_{family} gauge")
+            for label, value in sorted(values.items()):
+                lines.append(f'weather_{family}{{key="{label}"}} {value}')
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
+
+
+class CallTracker:
+    """
+    Counts tool calls in progress, so shutdown can wait for them to finish.
+    """
+
+    def __init__(self):
+        self.active = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    @contextmanager
+    def track(self) -> Iterator[None]:
+        self.active += 1
+        self._idle.clear()
+        try:
+            yield
+        finally:
+            self.active -= 1
+            if self.active == 0:
+                self._idle.set()
+
+    async def drain(self, timeout: float) -> bool:
+        """
+        Wait until no call is in progress; returns False if `timeout` seconds passed first.
+        """
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+ACTIVE_CALLS = CallTracker()
+
+
+def instrumented(func: Callable[..., Any]) -> Callable[..., Any]:
+    """
+    Decorator for MCP tools: tags the task with the tool name for METRICS, times the whole call and tracks it
+    in ACTIVE_CALLS. Apply below @mcp.tool(); the wrapped signature and docstring are preserved.
+    """
+    @functools.wraps(func)
+    async def wrapper(*args: Any, **kwargs: Any) -> Any:
+        token = _CURRENT_TOOL.set(func.__name__)
+        try:
+            with ACTIVE_CALLS.track(), METRICS.timed("total"):
+                result = await func(*args, **kwargs)
+            if isinstance(result, dict) and result.get("status") == "error":
+                METRICS.count("tool_errors")
+            return result
+        finally:
+            _CURRENT_TOOL.reset(token)
+    return wrapper
+
+# ----------------------------------------------------------------------------------------------------------------------
+# CACHING
+# ----------------------------------------------------------------------------------------------------------------------
+
+class GeocodeCache:
+    """
+    Two-tier geocoding cache: an in-memory LRU in front of a SQLite table, both with TTL and size-based eviction.
+    Keys are normalized place strings, values are (latitude, longitude) tuples.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = GEOCODE_CACHE_PATH,
+        ttl: float = GEOCODE_CACHE_TTL,
+        memory_size: int = GEOCODE_MEMORY_SIZE,
+        disk_max_entries: int = GEOCODE_DISK_MAX_ENTRIES
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.memory_size = memory_size
+        self.disk_max_entries = disk_max_entries
+        self._memory: "OrderedDict[str, Tuple[float, float, float]]" = OrderedDict()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._disk_writes = 0
+
+    @staticmethod
+    def normalize(location_name: str) -> str:
+        return " ".join(location_name.casefold().split())
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        if self._conn is None and self.path:
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                # Busy timeout: with several workers another process may be writing
+                self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=10)
+                self._conn.execute("PRAGMA journal_mode=WAL")  # readers in other worker processes are not blocked
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS geocode ("
+                    "key TEXT PRIMARY KEY, latitude REAL NOT NULL, longitude REAL NOT NULL, stored_at REAL NOT NULL)"
+                )
+                self._conn.execute("CREATE INDEX IF NOT EXISTS geocode_stored_at ON geocode(stored_at)")
+                self._conn.commit()
+            except sqlite3.Error as db_err:
+                logger.warning(f"Geocode disk cache unavailable at {self.path}: {db_err}")
+                self.path = None
+                self._conn = None
+        return self._conn
+
+    def _remember(self, key: str, latitude: float, longitude: float, stored_at: float) -> None:
+        self._memory[key] = (latitude, longitude, stored_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def _load(self, key: str, now: float) -> Optional[Tuple[float, float, float]]:
+        # Blocking (SQLite read): runs in a worker thread, see aget()
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return None
+            try:
+                row = conn.execute(
+                    "SELECT latitude, longitude, stored_at FROM geocode WHERE key = ?", (key,)
+                ).fetchone()
+            except sqlite3.Error as db_err:
+                logger.warning(f"Geocode disk cache read failed for '{key}': {db_err}")
+                return None
+        if row is None or now - row[2] >= self.ttl:
+            # Expired rows are removed by the periodic eviction in _write()
+            return None
+        return row[0], row[1], row[2]
+
+    def _write(self, key: str, latitude: float, longitude: float, now: float) -> None:
+        # Blocking (SQLite write): runs in a worker thread, see aput()
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO geocode (key, latitude, longitude, stored_at) VALUES (?, ?, ?, ?)",
+                    (key, latitude, longitude, now)
+                )
+                self._disk_writes += 1
+                if self._disk_writes % 100 == 0:
+                    conn.execute("DELETE FROM geocode WHERE stored_at < ?", (now - self.ttl,))
+                    conn.execute(
+                        "DELETE FROM geocode WHERE key IN ("
+                        "SELECT key FROM geocode ORDER BY stored_at DESC LIMIT -1 OFFSET ?)",
+                        (self.disk_max_entries,)
+                    )
+                conn.commit()
+            except sqlite3.Error as db_err:
+                logger.warning(f"Geocode disk cache write failed for '{key}': {db_err}")
+
+    def get(self, location_name: str) -> Optional[Tuple[float, float]]:
+        """
+        Memory-tier lookup.
+        """
+        key = self.normalize(location_name)
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry[2] >= self.ttl:
+            del self._memory[key]
+            return None
+        self._memory.move_to_end(key)
+        return entry[0], entry[1]
+
+    async def aget(self, location_name: str) -> Optional[Tuple[float, float]]:
+        """
+        get() that falls back to the disk tier (off the event loop) on a memory miss.
+        """
+        cached = self.get(location_name)
+        if cached is not None or not self.path:
+            return cached
+        key = self.normalize(location_name)
+        row = await asyncio.to_thread(self._load, key, time.time())
+        if row is None:
+            return None
+        self._remember(key, *row)
+        return row[0], row[1]
+
+    def put(self, location_name: str, latitude: float, longitude: float) -> None:
+        """
+        Memory-tier store.
+        """
+        self._remember(self.normalize(location_name), latitude, longitude, time.time())
+
+    async def aput(self, location_name: str, latitude: float, longitude: float) -> None:
+        """
+        put() that also writes the entry through to the disk tier (off the event loop).
+        """
+        self.put(location_name, latitude, longitude)
+        if self.path:
+            key = self.normalize(location_name)
+            await asyncio.to_thread(self._write, key, latitude, longitude, self._memory[key][2])
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+GEOCODE_CACHE = GeocodeCache()
+
+
+class ResponseCache:
+    """
+    In-memory LRU cache of upstream JSON responses keyed on the canonicalized (url, params), optionally backed
+    by a SQLite table shared with other worker processes (`path`). Cached payloads are shared between callers
+    and must be treated as read-only.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+        path: Optional[str] = None,
+        disk_max_entries: int = SHARED_CACHE_MAX_ENTRIES
+    ):
+        self.max_entries = max_entries
+        self.path = path
+        self.disk_max_entries = disk_max_entries
+        # key -> (data, stored_at, expires_at); expires_at is None for entries that never expire
+        self._entries: "OrderedDict[str, Tuple[Any, float, Optional[float]]]" = OrderedDict()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._disk_writes = 0
+
+    @staticmethod
+    def make_key(url: str, params: Dict[str, Any]) -> str:
+        return url + "?" + urlencode(sorted((k, str(v)) for k, v in params.items()))
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        if self._conn is None and self.path:
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                conn = sqlite3.connect(self.path, check_same_thread=False, timeout=10)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS responses ("
+                    "key TEXT PRIMARY KEY, data TEXT NOT NULL, stored_at REAL NOT NULL, expires_at REAL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS responses_stored_at ON responses(stored_at)")
+                conn.commit()
+                self._conn = conn
+            except sqlite3.Error as db_err:
+                logger.warning(f"Shared response cache unavailable at {self.path}: {db_err}")
+                self.path = None
+        return self._conn
+
+    def _remember(self, key: str, entry: Tuple[Any, float, Optional[float]]) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _load(self, key: str) -> Optional[Tuple[Any, float, Optional[float]]]:
+        # Blocking (SQLite read and JSON decode): runs in a worker thread, see aget()
+        conn = self._connect()
+        if conn is None:
+            return None
+        try:
+            with self._lock:
+                row = conn.execute("SELECT data, stored_at, expires_at FROM responses WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error as db_err:
+            logger.warning(f"Shared response cache read failed: {db_err}")
+            return None
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1], row[2]
+
+    def _write(self, key: str, data: Any, stored_at: float, expires_at: Optional[float]) -> None:
+        # Blocking (JSON encode and SQLite write): runs in a worker thread, see aput()
+        conn = self._connect()
+        if conn is None:
+            return
+        try:
+            # Streamed payloads carry array("d") columns
+            encoded = json.dumps(data, default=list)
+            with self._lock:
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, data, stored_at, expires_at) VALUES (?, ?, ?, ?)",
+                    (key, encoded, stored_at, expires_at)
+                )
+                self._disk_writes += 1
+                if self._disk_writes % 100 == 0:
+                    conn.execute("DELETE FROM responses WHERE expires_at < ?", (stored_at - STALE_MAX_AGE,))
+                    conn.execute(
+                        "DELETE FROM responses WHERE key IN ("
+                        "SELECT key FROM responses ORDER BY stored_at DESC LIMIT -1 OFFSET ?)",
+                        (self.disk_max_entries,)
+                    )
+                conn.commit()
+        except (sqlite3.Error, TypeError, ValueError) as err:
+            logger.warning(f"Shared response cache write failed: {err}")
+
+    @staticmethod
+    def _expired(entry: Optional[Tuple[Any, float, Optional[float]]], now: float) -> bool:
+        return entry is None or (entry[2] is not None and now >= entry[2])
+
+    def _lookup(
+        self, key: str, entry: Optional[Tuple[Any, float, Optional[float]]], now: float, max_stale: float
+    ) -> Tuple[Optional[Any], bool]:
+        if entry is None:
+            return None, False
+        data, _, expires_at = entry
+        if expires_at is None or now < expires_at:
+            self._entries.move_to_end(key)
+            return data, True
+        if now - expires_at < max_stale:
+            return data, False
+        self._entries.pop(key, None)
+        return None, False
+
+    def get(self, key: str, max_stale: float = 0.0) -> Tuple[Optional[Any], bool]:
+        """
+        Memory-tier lookup. Returns (data, fresh). Expired entries are returned with fresh=False if they expired
+        less than `max_stale` seconds ago; otherwise (None, False).
+        """
+        return self._lookup(key, self._entries.get(key), time.time(), max_stale)
+
+    async def aget(self, key: str, max_stale: float = 0.0) -> Tuple[Optional[Any], bool]:
+        """
+        get() that falls back to the shared tier (off the event loop) when memory has no fresh entry.
+        """
+        entry = self._entries.get(key)
+        if self.path and self._expired(entry, time.time()):
+            # Another worker may have stored (or refreshed) it
+            loaded = await asyncio.to_thread(self._load, key)
+            if loaded is not None:
+                self._remember(key, loaded)
+                entry = loaded
+        return self._lookup(key, entry, time.time(), max_stale)
+
+    def put(self, key: str, data: Any, ttl: float) -> None:
+        """
+        Memory-tier store; `ttl` of inf means the entry never expires.
+        """
+        now = time.time()
+        self._remember(key, (data, now, None if ttl == float("inf") else now + ttl))
+
+    async def aput(self, key: str, data: Any, ttl: float) -> None:
+        """
+        put() that also writes the entry through to the shared tier (off the event loop).
+        """
+        self.put(key, data, ttl)
+        if self.path:
+            _, stored_at, expires_at = self._entries[key]
+            await asyncio.to_thread(self._write, key, data, stored_at, expires_at)
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+RESPONSE_CACHE = ResponseCache()
+
+
+def forecast_cache_ttl(now: Optional[datetime] = None) -> float:
+    """
+    Seconds until the next forecast model update has been published, so cached forecasts expire with the model.
+    """
+    now = now or datetime.now(timezone.utc)
+    elapsed = (now.timestamp() - FORECAST_UPDATE_DELAY) % FORECAST_UPDATE_INTERVAL
+    return FORECAST_UPDATE_INTERVAL - elapsed
+
+
+def history_cache_ttl(end: date) -> float:
+    """
+    Archive ranges that end before the settle window never change; recent ones may still be revised.
+    """
+    if end < date.today() - timedelta(days=ARCHIVE_SETTLE_DAYS):
+        return float("inf")
+    return ARCHIVE_RECENT_CACHE_TTL
+
+# ----------------------------------------------------------------------------------------------------------------------
+# LOCAL ARCHIVE STORE
+# ----------------------------------------------------------------------------------------------------------------------
+
+class WeatherStore:
+    """
+    Local time-series store for archived data, keyed by rounded coordinate, resolution ("hourly"/"daily"),
+    variable and calendar month; each row holds one month of a variable as a compact JSON blob. A coverage
+    table records which date ranges are complete for each variable, so a range can be answered locally only
+    when every requested variable covers it.
+    Methods are blocking; run reads through asyncio.to_thread and writes on STORE_WRITER from async code.
+    """
+
+    def __init__(self, path: Optional[str] = STORE_PATH, precision: int = STORE_COORD_PRECISION):
+        self.path = path
+        self.precision = precision
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        # Reads use their own connection: in WAL mode they see the last committed data without waiting
+        # for a write (e.g. a background store of freshly fetched months) to finish
+        self._reader: Optional[sqlite3.Connection] = None
+        self._read_lock = threading.Lock()
+
+    def _read_connection(self) -> Optional[sqlite3.Connection]:
+        if self._reader is None:
+            with self._lock:
+                # Creates the schema on first use
+                if self._connect() is None:
+                    return None
+            self._reader = sqlite3.connect(self.path, check_same_thread=False)
+        return self._reader
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        if self._conn is None and self.path:
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                conn = sqlite3.connect(self.path, check_same_thread=False)
+                conn.execute("PRAGMA journal_mode=WAL")
+                if conn.execute("PRAGMA user_version").fetchone()[0] < STORE_SCHEMA_VERSION:
+                    # Earlier layouts kept one row per value; their coverage rows point at that table
+                    conn.executescript(
+                        "DROP TABLE IF EXISTS observations; DROP TABLE IF EXISTS coverage;"
+                        f" PRAGMA user_version = {STORE_SCHEMA_VERSION};"
+                    )
+                conn.executescript(
+                    "CREATE TABLE IF NOT EXISTS locations ("
+                    " lat REAL NOT NULL, lon REAL NOT NULL, meta TEXT NOT NULL, PRIMARY KEY (lat, lon));"
+                    "CREATE TABLE IF NOT EXISTS series ("
+                    " lat REAL NOT NULL, lon REAL NOT NULL, resolution TEXT NOT NULL, variable TEXT NOT NULL,"
+                    " month TEXT NOT NULL, data TEXT NOT NULL,"
+                    " PRIMARY KEY (lat, lon, resolution, variable, month)) WITHOUT ROWID;"
+                    "CREATE TABLE IF NOT EXISTS coverage ("
+                    " lat REAL NOT NULL, lon REAL NOT NULL, resolution TEXT NOT NULL, variable TEXT NOT NULL,"
+                    " start_date TEXT NOT NULL, end_date TEXT NOT NULL,"
+                    " PRIMARY KEY (lat, lon, resolution, variable, start_date));"
+                )
+                self._conn = conn
+            except sqlite3.Error as db_err:
+                logger.warning(f"Weather store unavailable at {self.path}: {db_err}")
+                self.path = None
+        return self._conn
+
+    def _location(self, coord: Coordinate) -> Tuple[float, float]:
+        return round(coord.latitude, self.precision), round(coord.longitude, self.precision)
+
+    def read_range(
+        self,
+        coord: Coordinate,
+        resolution: str,
+        variables: List[str],
+        start: date,
+        end: date
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Payload shaped like an archive API response for start..end, or None if the range is not fully covered.
+        """
+        lat, lon = self._location(coord)
+        with self._read_lock:
+            conn = self._read_connection()
+            if conn is None:
+                return None
+            try:
+                covered = conn.execute(
+                    f"SELECT COUNT(DISTINCT variable) FROM coverage WHERE lat = ? AND lon = ? AND resolution = ?"
+                    f" AND variable IN ({','.join('?' * len(variables))}) AND start_date <= ? AND end_date >= ?",
+                    (lat, lon, resolution, *variables, start.isoformat(), end.isoformat())
+                ).fetchone()[0]
+                if covered < len(variables):
+                    return None
+                meta_row = conn.execute("SELECT meta FROM locations WHERE lat = ? AND lon = ?", (lat, lon)).fetchone()
+                if meta_row is None:
+                    return None
+                rows = conn.execute(
+                    f"SELECT variable, data FROM series WHERE lat = ? AND lon = ? AND resolution = ?"
+                    f" AND variable IN ({','.join('?' * len(variables))}) AND month BETWEEN ? AND ? ORDER BY month",
+                    (lat, lon, resolution, *variables, start.isoformat()[:7], end.isoformat()[:7])
+                ).fetchall()
+            except sqlite3.Error as db_err:
+                logger.warning(f"Weather store read failed: {db_err}")
+                return None
+
+        series: Dict[str, Tuple[List[str], List[Any]]] = {variable: ([], []) for variable in variables}
+        for variable, data in rows:
+            times, values = json.loads(data)
+            series[variable][0].extend(times)
+            series[variable][1].extend(values)
+        block: Dict[str, List[Any]] = {}
+        for variable in variables:
+            times, values = series[variable]
+            lo = bisect_left(times, start.isoformat())
+            hi = bisect_right(times, end.isoformat() + "\uffff")
+            if "time" not in block:
+                block["time"] = times[lo:hi]
+            elif times[lo:hi] != block["time"]:
+                return None
+            block[variable] = values[lo:hi]
+
+        payload = json.loads(meta_row[0])
+        # Units are stored per location for every variable ever written there; only return the requested ones
+        units = {
+            name: unit for name, unit in payload.pop("units", {}).get(resolution, {}).items()
+            if name == "time" or name in variables
+        }
+        if units:
+            payload[f"{resolution}_units"] = units
+        payload[resolution] = block
+        return payload
+
+    def write_range(self, coord: Coordinate, resolution: str, start: date, end: date, payload: Dict[str, Any]) -> None:
+        """
+        Store the `resolution` block of an archive payload covering start..end and mark the range as covered.
+        """
+        block = payload.get(resolution)
+        if not block or "time" not in block:
+            return
+        lat, lon = self._location(coord)
+        times = list(block["time"])
+        variables = [variable for variable in block if variable != "time"]
+        meta = {
+            name: value for name, value in payload.items()
+            if name not in ("minutely_15", "hourly", "daily", "generationtime_ms") and not name.endswith("_units")
+        }
+        # Row ranges of each calendar month ("YYYY-MM") in the time column
+        months: List[Tuple[str, int, int]] = []
+        for index, time_value in enumerate(times):
+            if not months or months[-1][0] != time_value[:7]:
+                months.append((time_value[:7], index, index))
+            months[-1] = (months[-1][0], months[-1][1], index + 1)
+
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return
+            try:
+                row = conn.execute("SELECT meta FROM locations WHERE lat = ? AND lon = ?", (lat, lon)).fetchone()
+                units = json.loads(row[0]).get("units", {}) if row else {}
+                units.setdefault(resolution, {}).update(payload.get(f"{resolution}_units", {}))
+                meta["units"] = units
+                # Months already partly stored (e.g. the current month) are merged with the new values
+                existing = {
+                    (variable, month): json.loads(data) for variable, month, data in conn.execute(
+                        f"SELECT variable, month, data FROM series WHERE lat = ? AND lon = ? AND resolution = ?"
+                        f" AND variable IN ({','.join('?' * len(variables))}) AND month BETWEEN ? AND ?",
+                        (lat, lon, resolution, *variables, months[0][0], months[-1][0])
+                    )
+                } if months and variables else {}
+                rows: List[Tuple[Any, ...]] = []
+                for variable in variables:
+                    # Streamed payloads carry array("d") columns with NaN for missing values
+                    values = [None if value != value else value for value in block[variable]]
+                    for month, lo, hi in months:
+                        month_times, month_values = times[lo:hi], values[lo:hi]
+                        stored = existing.get((variable, month))
+                        if stored is not None and not set(stored[0]) <= set(month_times):
+                            merged = dict(zip(*stored))
+                            merged.update(zip(month_times, month_values))
+                            month_times = sorted(merged)
+                            month_values = [merged[t] for t in month_times]
+                        rows.append((lat, lon, resolution, variable, month, json.dumps([month_times, month_values])))
+                with conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO locations (lat, lon, meta) VALUES (?, ?, ?)", (lat, lon, json.dumps(meta))
+                    )
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO series (lat, lon, resolution, variable, month, data)"
+                        " VALUES (?, ?, ?, ?, ?, ?)",
+                        rows
+                    )
+                    conn.executemany(
+                        # A shorter range starting on the same day must not shrink existing coverage
+                        "INSERT INTO coverage (lat, lon, resolution, variable, start_date, end_date)"
+                        " VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (lat, lon, resolution, variable, start_date)"
+                        " DO UPDATE SET end_date = max(end_date, excluded.end_date)",
+                        ((lat, lon, resolution, variable, start.isoformat(), end.isoformat()) for variable in variables)
+                    )
+            except sqlite3.Error as db_err:
+                logger.warning(f"Weather store write failed: {db_err}")
+
+    def close(self) -> None:
+        with self._read_lock:
+            if self._reader is not None:
+                self._reader.close()
+                self._reader = None
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+WEATHER_STORE = WeatherStore()
+# Store writes run one at a time on their own thread, so write-through of freshly fetched months never occupies
+# the default executor that store reads and cache lookups on the response path use
+STORE_WRITER = ThreadPoolExecutor(max_workers=1, thread_name_prefix="weather-store-writer")
+
+# ----------------------------------------------------------------------------------------------------------------------
+# SPATIAL INDEX
+# ----------------------------------------------------------------------------------------------------------------------
+
+class GridIndex:
+    """
+    Maps coordinates to the canonical point of their cell on a regular lattice of `resolution` degrees
+    (geohash-style buckets, so lookups are O(1) arithmetic) and counts requests that snapping merges, i.e. that
+    land in a known cell with a different coordinate than the one the cell was first seen with.
+    """
+
+    def __init__(self, resolution: float, max_cells: int = GRID_INDEX_MAX_CELLS):
+        self.resolution = resolution
+        self.max_cells = max_cells
+        # cell -> first coordinate seen there, least recently used first
+        self._cells: "OrderedDict[Tuple[int, int], Tuple[float, float]]" = OrderedDict()
+        self.lookups = 0
+        self.hits = 0
+
+    def snap(self, coord: Coordinate) -> Coordinate:
+        if self.resolution <= 0:
+            return coord
+        cell = (round(coord.latitude / self.resolution), round(coord.longitude / self.resolution))
+        first = self._cells.get(cell)
+        if first is None:
+            self._cells[cell] = (coord.latitude, coord.longitude)
+            while len(self._cells) > self.max_cells:
+                self._cells.popitem(last=False)
+        else:
+            self._cells.move_to_end(cell)
+        # Repeats of the same coordinate would share a cache entry anyway, and prefetch refreshes are not requests
+        if _CURRENT_TOOL.get() != "background":
+            self.lookups += 1
+            if first is not None and first != (coord.latitude, coord.longitude):
+                self.hits += 1
+        # Rounding keeps the canonical point free of float noise (0.30000000000000004), so cache keys match
+        return Coordinate(
+            latitude=max(-90.0, min(90.0, round(cell[0] * self.resolution, 6))),
+            longitude=max(-180.0, min(180.0, round(cell[1] * self.resolution, 6)))
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "resolution_deg": self.resolution,
+            "cells": len(self._cells),
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "hit_rate": round(self.hits / self.lookups, 4) if self.lookups else None,
+        }
+
+
+GRID_INDEXES: Dict[str, GridIndex] = {dataset: GridIndex(resolution) for dataset, resolution in GRID_RESOLUTION.items()}
+
+
+def snap_coordinate(coord: Coordinate, dataset: str) -> Coordinate:
+    """
+    Canonical grid point for `coord` in `dataset` ("forecast" or "history").
+    """
+    return GRID_INDEXES[dataset].snap(coord)
+
+
+def snap_report(requested: Coordinate, snapped: Coordinate) -> Dict[str, Any]:
+    """
+    Response fields with the coordinate the caller asked for and the one the data was fetched for.
+    """
+    return {
+        "requested": {"latitude": requested.latitude, "longitude": requested.longitude},
+        "snapped": {"latitude": snapped.latitude, "longitude": snapped.longitude},
+    }
+
+# ----------------------------------------------------------------------------------------------------------------------
+# REQUEST SCHEDULING
+# ----------------------------------------------------------------------------------------------------------------------
+
+class SharedTokenBuckets:
+    """
+    Per-host token buckets kept in a SQLite table, so all worker processes draw from one request budget.
+    Methods are blocking; call them through asyncio.to_thread from async code.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS token_buckets (host TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+            )
+            self._conn = conn
+        return self._conn
+
+    def take(self, host: str, rate: float, burst: int) -> float:
+        """
+        Take a token for `host` if one is available. Returns 0.0 on success, else the seconds until the next token.
+        Raises sqlite3.Error.
+        """
+        with self._lock:
+            conn = self._connect()
+            # BEGIN IMMEDIATE takes the write lock up front, so concurrent workers cannot both spend the same token
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                row = conn.execute("SELECT tokens, updated FROM token_buckets WHERE host = ?", (host,)).fetchone()
+                tokens = float(burst) if row is None else min(float(burst), row[0] + max(0.0, now - row[1]) * rate)
+                wait = 0.0 if tokens >= 1.0 else (1.0 - tokens) / rate
+                if wait == 0.0:
+                    tokens -= 1.0
+                conn.execute(
+                    "INSERT OR REPLACE INTO token_buckets (host, tokens, updated) VALUES (?, ?, ?)", (host, tokens, now)
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+        return wait
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+class HostLimiter:
+    """
+    Token bucket plus in-flight cap for a single upstream host. Callers are admitted in FIFO order.
+    With `shared` buckets the rate limit holds across worker processes; the in-flight cap is per process.
+    """
+
+    def __init__(self, host: str, rate: float, burst: int, max_in_flight: int,
+                 shared: Optional[SharedTokenBuckets] = None):
+        self.host = host
+        self.rate = rate
+        self.burst = burst
+        self.max_in_flight = max_in_flight
+        self.shared = shared
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._gate = asyncio.Lock()  # asyncio.Lock wakes waiters in FIFO order
+        self._slots = asyncio.Semaphore(max_in_flight)
+        # Statistics
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.in_flight = 0
+        self.admitted = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    async def _take_token(self) -> None:
+        while self.shared is not None:
+            try:
+                wait = await asyncio.to_thread(self.shared.take, self.host, self.rate, self.burst)
+            except sqlite3.Error as db_err:
+                logger.warning(f"Shared rate limit for {self.host} unavailable, limiting per process: {db_err}")
+                self.shared = None
+                break
+            if wait == 0.0:
+                return
+            await asyncio.sleep(wait)
+        while True:
+            now = time.monotonic()
+            self._tokens = min(float(self.burst), self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return
+            await asyncio.sleep((1.0 - self._tokens) / self.rate)
+
+    async def acquire(self) -> float:
+        """
+        Wait for an in-flight slot and a token; returns the time spent waiting in seconds.
+        """
+        enqueued = time.monotonic()
+        self.queue_depth += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+        try:
+            # Only the head of the queue holds the gate, so slots and tokens are handed out in arrival order
+            async with self._gate:
+                await self._slots.acquire()
+                try:
+                    await self._take_token()
+                except BaseException:
+                    self._slots.release()
+                    raise
+        finally:
+            self.queue_depth -= 1
+
+        waited = time.monotonic() - enqueued
+        self.in_flight += 1
+        self.admitted += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+        return waited
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._slots.release()
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "admitted": self.admitted,
+            "avg_wait_seconds": self.total_wait / self.admitted if self.admitted else 0.0,
+            "max_wait_seconds": self.max_wait,
+        }
+
+
+class RequestScheduler:
+    """
+    Process-wide scheduler for all outbound HTTP traffic, with one HostLimiter per upstream host.
+    `shared_path` makes the rate limits global across worker processes (see SharedTokenBuckets).
+    """
+
+    def __init__(
+        self,
+        limits: Dict[str, Tuple[float, int, int]] = HOST_LIMITS,
+        default_limits: Tuple[float, int, int] = DEFAULT_HOST_LIMITS,
+        shared_path: Optional[str] = None
+    ):
+        self.limits = limits
+        self.default_limits = default_limits
+        self.shared = SharedTokenBuckets(shared_path) if shared_path else None
+        self._limiters: Dict[str, HostLimiter] = {}
+
+    def limiter(self, host: str) -> HostLimiter:
+        limiter = self._limiters.get(host)
+        if limiter is None:
+            rate, burst, max_in_flight = self.limits.get(host, self.default_limits)
+            limiter = HostLimiter(host, rate, burst, max_in_flight, self.shared)
+            self._limiters[host] = limiter
+        return limiter
+
+    @asynccontextmanager
+    async def slot(self, url: str) -> AsyncIterator[float]:
+        """
+        Hold a request slot for the host (host:port if given) of `url`; a bare host name is accepted too.
+        """
+        host = urlsplit(url).netloc or url
+        limiter = self.limiter(host)
+        waited = await limiter.acquire()
+        METRICS.observe("upstream_queue", waited, host)
+        try:
+            yield waited
+        finally:
+            limiter.release()
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        return {host: limiter.stats() for host, limiter in self._limiters.items()}
+
+    def close(self) -> None:
+        if self.shared is not None:
+            self.shared.close()
+
+
+SCHEDULER = RequestScheduler()
+
+# ----------------------------------------------------------------------------------------------------------------------
+# HTTP CLIENT
+# ----------------------------------------------------------------------------------------------------------------------
+
+# Reusable HTTP client; None until the server lifespan (or the first request outside it) creates it
+client: Optional[httpx.AsyncClient] = None
+
+
+def create_http_client() -> httpx.AsyncClient:
+    """
+    Build the shared client with tuned pool limits and HTTP/2 when available. httpx negotiates gzip/deflate
+    and, when the brotli package is installed, br compression via Accept-Encoding automatically.
+    """
+    http2 = HTTP2_ENABLED and importlib.util.find_spec("h2") is not None
+    if HTTP2_ENABLED and not http2:
+        logger.warning("HTTP/2 requested but the h2 package is not installed; falling back to HTTP/1.1.")
+    return httpx.AsyncClient(
+        timeout=DEFAULT_TIMEOUT,
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+        )
+    )
+
+
+def get_http_client() -> httpx.AsyncClient:
+    global client
+    if client is None:
+        client = create_http_client()
+    return client
+
+
+async def close_http_client() -> None:
+    global client
+    if client is not None:
+        await client.aclose()
+        client = None
+
+
+def http_pool_stats() -> Dict[str, Any]:
+    """
+    Connection pool utilization of the shared client, read from httpcore's pool (best effort).
+    """
+    stats: Dict[str, Any] = {"max_connections": HTTP_MAX_CONNECTIONS, "max_keepalive": HTTP_MAX_KEEPALIVE}
+    pool = getattr(getattr(client, "_transport", None), "_pool", None)
+    try:
+        connections = list(pool.connections) if pool is not None else []
+        idle = sum(1 for connection in connections if connection.is_idle())
+        stats.update({
+            "connections": len(connections),
+            "active_connections": len(connections) - idle,
+            "idle_connections": idle,
+            "http2_connections": sum(
+                1 for connection in connections
+                if type(getattr(connection, "_connection", None)).__name__ == "AsyncHTTP2Connection"
+            ),
+            "queued_requests": len(getattr(pool, "_requests", [])),
+            "utilization": (len(connections) - idle) / HTTP_MAX_CONNECTIONS,
+        })
+    except Exception as err:
+        logger.debug(f"Could not read HTTP pool statistics: {err}")
+    return stats
+
+# ----------------------------------------------------------------------------------------------------------------------
+# HELPER FUNCTIONS
+# ----------------------------------------------------------------------------------------------------------------------
+
+async def _fetch_upstream(
+    url: str,
+    params: Dict[str, Any],
+    count_key: str
+) -> Dict[str, Any]:
+    """
+    Core HTTP GET utility with retry/backoff and API call tracking.
+    """
+    http = get_http_client()
+    host = urlsplit(url).netloc or url
+    API_CALLS[count_key] += 1
+    log_sampled(logging.INFO, "Initiating %s API call #%d to %s with params: %s", count_key, API_CALLS[count_key], url, params)
+
+    async def request_once() -> Dict[str, Any]:
+        async with SCHEDULER.slot(url):
+            with METRICS.timed("upstream", host):
+                resp = await http.get(url, params=params)
+        resp.raise_for_status()
+        with METRICS.timed("json_decode", host):
+            return resp.json()
+
+    backoff = 1
+    for attempt in range(3):
+        try:
+            data = await request_once()
+            log_sampled(logging.INFO, "API call to %s successful.", url)
+            return data
+        except httpx.TimeoutException as timeout_err:
+            METRICS.count("timeouts")
+            logger.warning("%s timeout error attempt %d: %s", count_key, attempt + 1, timeout_err)
+            if attempt == 2: raise
+            METRICS.count("retries")
+            await asyncio.sleep(backoff)
+            backoff *= 2
+        except httpx.HTTPStatusError as st_err:
+            METRICS.count("http_errors")
+            logger.error("%s HTTP status %d for %s. Response: %s", count_key, st_err.response.status_code, url, st_err.response.text)
+            raise
+        except httpx.RequestError as req_err:
+            METRICS.count("network_errors")
+            logger.warning("%s network error attempt %d: %s", count_key, attempt + 1, req_err)
+            if attempt == 2: raise
+            METRICS.count("retries")
+            await asyncio.sleep(backoff)
+            backoff *= 2
+
+    # Fallback attempt 
+    data = await request_once()
+    logger.info("API call to %s successful on final attempt.", url)
+    return data
+
+
+# Upstream requests currently in progress, keyed like RESPONSE_CACHE, so identical concurrent calls share one fetch
+_INFLIGHT: Dict[str, "asyncio.Future[Dict[str, Any]]"] = {}
+# Strong references to background refresh tasks so they are not garbage-collected mid-flight
+_BACKGROUND_TASKS: set = set()
+
+
+async def _fetch_and_store(
+    key: str,
+    url: str,
+    params: Dict[str, Any],
+    count_key: str,
+    cache_ttl: Optional[float]
+) -> Dict[str, Any]:
+    data = await _fetch_upstream(url, params, count_key)
+    if cache_ttl is not None:
+        await RESPONSE_CACHE.aput(key, data, cache_ttl)
+    return data
+
+
+async def _coalesced_fetch(
+    key: str,
+    url: str,
+    params: Dict[str, Any],
+    count_key: str,
+    cache_ttl: Optional[float]
+) -> Dict[str, Any]:
+    task = _INFLIGHT.get(key)
+    if task is not None:
+        CACHE_STATS["response_coalesced"] += 1
+        log_sampled(logging.DEBUG, "Coalescing %s request onto in-flight call for %s", count_key, key)
+    else:
+        task = asyncio.ensure_future(_fetch_and_store(key, url, params, count_key, cache_ttl))
+        _INFLIGHT[key] = task
+        task.add_done_callback(lambda _: _INFLIGHT.pop(key, None))
+    # Shield so that one cancelled caller does not cancel the fetch other callers are waiting on
+    return await asyncio.shield(task)
+
+
+def _refresh_in_background(
+    key: str,
+    url: str,
+    params: Dict[str, Any],
+    count_key: str,
+    cache_ttl: float
+) -> None:
+    if key in _INFLIGHT:
+        return
+
+    async def refresh() -> None:
+        try:
+            await _coalesced_fetch(key, url, params, count_key, cache_ttl)
+        except Exception as err:
+            logger.warning(f"Background refresh of {count_key} data failed: {err}")
+
+    task = asyncio.ensure_future(refresh())
+    _BACKGROUND_TASKS.add(task)
+    task.add_done_callback(_BACKGROUND_TASKS.discard)
+
+
+async def fetch_json(
+    url: str,
+    params: Dict[str, Any],
+    count_key: str,
+    cache_ttl: Optional[float] = None,
+    stale_while_revalidate: bool = False
+) -> Dict[str, Any]:
+    """
+    Cached, coalesced front end to _fetch_upstream.
+    - `cache_ttl`: seconds to keep the response in RESPONSE_CACHE (float("inf") for no expiry, None to skip caching).
+    - `stale_while_revalidate`: return an expired entry (up to STALE_MAX_AGE old) immediately and refresh it in the background.
+    Identical concurrent requests always share a single upstream call.
+    """
+    key = ResponseCache.make_key(url, params)
+    if cache_ttl is not None:
+        data, fresh = await RESPONSE_CACHE.aget(key, STALE_MAX_AGE if stale_while_revalidate else 0.0)
+        if data is not None:
+            if fresh:
+                CACHE_STATS["response_hits"] += 1
+            else:
+                CACHE_STATS["response_stale"] += 1
+                _refresh_in_background(key, url, params, count_key, cache_ttl)
+            return data
+        CACHE_STATS["response_misses"] += 1
+    return await _coalesced_fetch(key, url, params, count_key, cache_ttl)
+
+
+# Reusable Nominatim geocoder; its aiohttp session is created lazily on first use and closed by close_geocoder().
+# Request pacing is handled by SCHEDULER so that concurrent tool calls share Nominatim's rate limit.
+_geolocator: Optional[Geocoder] = None
+
+
+def _get_geocoder() -> Geocoder:
+    global _geolocator
+    if _geolocator is None:
+        _geolocator = Nominatim(
+            user_agent="openmeteo_mcp_tool",
+            domain=NOMINATIM_DOMAIN,
+            scheme=NOMINATIM_SCHEME,
+            adapter_factory=AioHTTPAdapter,
+            timeout=15
+        )
+    return _geolocator
+
+
+async def close_geocoder() -> None:
+    """
+    Close the shared Nominatim session (if one was opened).
+    """
+    global _geolocator
+    if _geolocator is not None:
+        await _geolocator.__aexit__(None, None, None)
+    _geolocator = None
+
+
+# Geocodes currently in progress, keyed by normalized place name, so concurrent lookups of one place share a call
+_GEOCODE_INFLIGHT: Dict[str, "asyncio.Future[Tuple[float, float]]"] = {}
+
+
+async def get_coordinates(location_name: str) -> Tuple[float, float]:
+    """
+    Geocode a free-text location using Nominatim (OpenStreetMap) via geopy.
+    Results are served from GEOCODE_CACHE when possible; only misses hit the network, once per place name
+    however many callers ask for it concurrently.
+    """
+    cached = GEOCODE_CACHE.get(location_name)
+    if cached is not None:
+        CACHE_STATS["geocoding_hits"] += 1
+        return cached
+    key = GeocodeCache.normalize(location_name)
+    task = _GEOCODE_INFLIGHT.get(key)
+    if task is not None:
+        CACHE_STATS["geocoding_coalesced"] += 1
+    else:
+        task = asyncio.ensure_future(_geocode(location_name))
+        _GEOCODE_INFLIGHT[key] = task
+        task.add_done_callback(lambda _: _GEOCODE_INFLIGHT.pop(key, None))
+    # Shield so that one cancelled caller does not cancel the lookup other callers are waiting on
+    return await asyncio.shield(task)
+
+
+async def _geocode(location_name: str) -> Tuple[float, float]:
+    cached = await GEOCODE_CACHE.aget(location_name)
+    if cached is not None:
+        CACHE_STATS["geocoding_hits"] += 1
+        log_sampled(logging.INFO, "Geocoding cache hit for '%s': %s", location_name, cached)
+        return cached
+    CACHE_STATS["geocoding_misses"] += 1
+
+    API_CALLS["geocoding"] += 1
+    log_sampled(logging.INFO, "Geocoding call #%d for '%s'", API_CALLS["geocoding"], location_name)
+    try:
+        geolocator = _get_geocoder()
+        logger.debug("Attempting geocode for: %s", location_name)
+        async with SCHEDULER.slot(NOMINATIM_DOMAIN):
+            with METRICS.timed("upstream", NOMINATIM_DOMAIN):
+                location = await geolocator.geocode(location_name, exactly_one=True)
+        logger.debug("Geocode result for '%s': %s", location_name, location)
+        if location is None:
+            logger.warning(f"Geocoding failed: Location '{location_name}' not found.")
+            raise ValueError(f"Location '{location_name}' not found.")
+        log_sampled(logging.INFO, "Geocoding successful for '%s': (%s, %s)", location_name, location.latitude, location.longitude)
+        await GEOCODE_CACHE.aput(location_name, location.latitude, location.longitude)
+        return location.latitude, location.longitude
+    except Exception as e:
+        logger.error(f"Geocoding error for '{location_name}': {e}", exc_info=True)
+        raise ValueError(f"Failed to geocode '{location_name}': {e}")
+
+
+def month_chunks(start: date, end: date) -> List[Tuple[date, date]]:
+    """
+    Split start..end into calendar-month chunks. Months that are already over are whole chunks, so the same
+    chunk (and its cache entry) is reused by any range overlapping it; the current month is cut at `end`.
+    fetch_range() decides whether a partly requested edge chunk is fetched whole.
+    """
+    today = date.today()
+    chunks: List[Tuple[date, date]] = []
+    month_start = start.replace(day=1)
+    while month_start <= end:
+        next_month = (month_start.replace(day=28) + timedelta(days=4)).replace(day=1)
+        month_end = next_month - timedelta(days=1)
+        chunks.append((month_start, month_end if month_end < today else min(month_end, end)))
+        month_start = next_month
+    return chunks
+
+
+def fetch_range(chunk_start: date, chunk_end: date, start: date, end: date) -> Tuple[date, date]:
+    """
+    Range to request upstream for the month chunk chunk_start..chunk_end of a start..end request: the whole
+    chunk when the request covers most of it (so its cache entry and stored rows serve other ranges too),
+    otherwise only the requested days.
+    """
+    clipped_start, clipped_end = max(chunk_start, start), min(chunk_end, end)
+    covered = (clipped_end - clipped_start).days + 1
+    if covered >= HISTORY_WHOLE_MONTH_FRACTION * ((chunk_end - chunk_start).days + 1):
+        return chunk_start, chunk_end
+    return clipped_start, clipped_end
+
+
+def stitch_chunks(parts: List[Dict[str, Any]], key: str, start: date, end: date) -> Dict[str, Any]:
+    """
+    Concatenate the `key` block ("hourly"/"daily") of consecutive chunk responses and trim it to start..end.
+    Chunk payloads come from the response cache and are not modified.
+    """
+    merged = {name: value for name, value in parts[0].items() if name != key}
+    columns: Dict[str, Any] = {}
+    for name in dict.fromkeys(name for part in parts for name in part.get(key, {})):
+        pieces = [part[key][name] for part in parts if name in part.get(key, {})]
+        # Streamed parts carry compact array("d") columns (NaN for null), stored/cached parts JSON lists (None).
+        # Keep the column compact only if every part is; otherwise convert each piece before joining.
+        if all(isinstance(piece, array) for piece in pieces):
+            column: Any = array("d")
+            for piece in pieces:
+                column.extend(piece)
+        else:
+            column = []
+            for piece in pieces:
+                column.extend([None if value != value else value for value in piece] if isinstance(piece, array) else piece)
+        columns[name] = column
+
+    # Time strings are ISO formatted ("YYYY-MM-DD" or "YYYY-MM-DDTHH:MM"), so they sort chronologically
+    times = columns.get("time", [])
+    lo = bisect_left(times, start.isoformat())
+    hi = bisect_right(times, end.isoformat() + "\uffff")
+    merged[key] = {name: values[lo:hi] for name, values in columns.items()}
+    merged["generationtime_ms"] = sum(part.get("generationtime_ms", 0.0) for part in parts)
+    return merged
+
+
+async def _retry_server_errors(url: str, params: Dict[str, Any], key: str, count_key: str,
+                               cache_ttl: Optional[float]) -> Any:
+    """
+    _coalesced_fetch with extra attempts for HTTP 429/5xx, which _fetch_upstream does not retry.
+    """
+    backoff = 1
+    for _ in range(PACKET_RETRIES):
+        try:
+            return await _coalesced_fetch(key, url, params, count_key, cache_ttl)
+        except httpx.HTTPStatusError as st_err:
+            status = st_err.response.status_code
+            if status != 429 and status < 500:
+                raise
+            logger.warning("%s request failed with HTTP %d, retrying", count_key, status)
+            METRICS.count("retries")
+            await asyncio.sleep(backoff)
+            backoff *= 2
+    # Final attempt
+    return await _coalesced_fetch(key, url, params, count_key, cache_ttl)
+
+
+async def _fetch_packet(
+    url: str,
+    single_params: List[Dict[str, Any]],
+    keys: List[str],
+    count_key: str,
+    cache_ttl: Optional[float],
+    probe: bool = True
+) -> List[Any]:
+    """
+    Fetch several locations in one request using Open-Meteo's comma-separated coordinate lists.
+    Each location's payload is cached under the key a single-location request would use.
+    Returns one payload or exception per location. A rejected packet (HTTP 400) is bisected to isolate the
+    failing sites; `probe` first checks whether the shared parameters are at fault instead.
+    """
+    if not keys:
+        return []
+    if len(keys) == 1:
+        try:
+            return [await _retry_server_errors(url, single_params[0], keys[0], count_key, cache_ttl)]
+        except Exception as err:
+            return [err]
+
+    packed = dict(single_params[0])
+    packed["latitude"] = ",".join(str(params["latitude"]) for params in single_params)
+    packed["longitude"] = ",".join(str(params["longitude"]) for params in single_params)
+    try:
+        payload = await _retry_server_errors(url, packed, ResponseCache.make_key(url, packed), count_key, None)
+    except httpx.HTTPStatusError as st_err:
+        if st_err.response.status_code != 400:
+            return [st_err] * len(keys)
+        if not probe:
+            # Split in halves, so k bad sites cost O(k log n) extra requests rather than one request per site
+            middle = len(keys) // 2
+            left, right = await asyncio.gather(
+                _fetch_packet(url, single_params[:middle], keys[:middle], count_key, cache_ttl, probe=False),
+                _fetch_packet(url, single_params[middle:], keys[middle:], count_key, cache_ttl, probe=False)
+            )
+            return left + right
+        # A 400 is usually caused by the shared parameters; probe sites alone before blaming a single one
+        first, last = await asyncio.gather(
+            _fetch_packet(url, single_params[:1], keys[:1], count_key, cache_ttl),
+            _fetch_packet(url, single_params[-1:], keys[-1:], count_key, cache_ttl)
+        )
+        inner_params, inner_keys = single_params[1:-1], keys[1:-1]
+        if isinstance(first[0], Exception) and isinstance(last[0], Exception):
+            if not inner_keys:
+                return first + last
+            # Both ends rejected: only blame the shared parameters if a middle site fails alone too
+            middle = len(inner_keys) // 2
+            center = await _fetch_packet(url, inner_params[middle:middle + 1], inner_keys[middle:middle + 1],
+                                         count_key, cache_ttl)
+            if isinstance(center[0], Exception):
+                return [st_err] * len(keys)
+            logger.warning(f"{count_key} batch of {len(keys)} locations rejected, isolating the failing site(s)")
+            left, right = await asyncio.gather(
+                _fetch_packet(url, inner_params[:middle], inner_keys[:middle], count_key, cache_ttl, probe=False),
+                _fetch_packet(url, inner_params[middle + 1:], inner_keys[middle + 1:], count_key, cache_ttl, probe=False)
+            )
+            return first + left + center + right + last
+        logger.warning(f"{count_key} batch of {len(keys)} locations rejected, isolating the failing site(s)")
+        inner = await _fetch_packet(url, inner_params, inner_keys, count_key, cache_ttl, probe=False)
+        return first + inner + last
+    except Exception as err:
+        return [err] * len(keys)
+
+    if isinstance(payload, dict):
+        payload = [payload]
+    if len(payload) != len(keys):
+        err = ValueError(f"Upstream returned {len(payload)} results for {len(keys)} locations.")
+        return [err] * len(keys)
+    if cache_ttl is not None:
+        for key, part in zip(keys, payload):
+            await RESPONSE_CACHE.aput(key, part, cache_ttl)
+    return payload
+
+
+async def fetch_packed(
+    url: str,
+    params: Dict[str, Any],
+    coords: Sequence[Coordinate],
+    count_key: str,
+    cache_ttl: Optional[float],
+    refresh: bool = False
+) -> List[Any]:
+    """
+    Fetch the same request for many coordinates, serving cached locations directly and packing the rest
+    into as few upstream requests as BATCH_MAX_LOCATIONS allows. Returns one payload or exception per coordinate.
+    `refresh` skips the cache lookup (the fresh payloads are still cached).
+    """
+    results: List[Any] = [None] * len(coords)
+    pending: Dict[str, List[int]] = {}       # single-location cache key -> positions in coords
+    single: Dict[str, Dict[str, Any]] = {}   # single-location cache key -> its request params
+    for index, coord in enumerate(coords):
+        location_params = {**params, "latitude": coord.latitude, "longitude": coord.longitude}
+        key = ResponseCache.make_key(url, location_params)
+        if key not in pending:
+            data, fresh = await RESPONSE_CACHE.aget(key) if cache_ttl is not None and not refresh else (None, False)
+            if fresh:
+                CACHE_STATS["response_hits"] += 1
+                results[index] = data
+                continue
+            if cache_ttl is not None and not refresh:
+                CACHE_STATS["response_misses"] += 1
+            single[key] = location_params
+        pending.setdefault(key, []).append(index)
+
+    keys = list(pending)
+    packets = [keys[i:i + BATCH_MAX_LOCATIONS] for i in range(0, len(keys), BATCH_MAX_LOCATIONS)]
+
+    async def run_packet(packet: List[str]) -> None:
+        payloads = await _fetch_packet(url, [single[key] for key in packet], packet, count_key, cache_ttl)
+        for key, payload in zip(packet, payloads):
+            for index in pending[key]:
+                results[index] = payload
+
+    await asyncio.gather(*(run_packet(packet) for packet in packets))
+    return results
+
+
+async def fetch_history_many(
+    coords: Sequence[Coordinate],
+    start: date,
+    end: date,
+    key: str,
+    param_vars: str
+) -> List[Any]:
+    """
+    Fetch start..end from the archive API for every coordinate as month chunks with bounded parallelism
+    (edge months only partly requested are clipped, see fetch_range), then stitch each location's chunks together. Each (location, chunk) is cached on its own, so extending
+    a range only fetches the new chunks, and a failed chunk is retried without refetching the others.
+    Returns one payload or exception per coordinate.
+    """
+    semaphore = asyncio.Semaphore(HISTORY_CHUNK_CONCURRENCY)
+
+    variables = [variable.strip() for variable in param_vars.split(",") if variable.strip()]
+
+    async def fetch_chunk(chunk_start: date, chunk_end: date) -> List[Any]:
+        fetch_start, fetch_end = fetch_range(chunk_start, chunk_end, start, end)
+        clipped = (fetch_start, fetch_end) != (chunk_start, chunk_end)
+        params = {
+            "start_date": fetch_start.isoformat(), "end_date": fetch_end.isoformat(),
+            "timezone": TIMEZONE, key: param_vars
+        }
+        # Only final archive months go to the local store; recent ones may still be revised upstream.
+        # Stored months are kept in memory only briefly, so the cache does not duplicate the store
+        use_store = history_cache_ttl(fetch_end) == float("inf")
+        cache_ttl = ARCHIVE_MEMORY_TTL if use_store else history_cache_ttl(fetch_end)
+        # A clipped chunk is also answered by the whole month, if another request cached it
+        ranges = [(chunk_start, chunk_end), (fetch_start, fetch_end)] if clipped else [(fetch_start, fetch_end)]
+        async with semaphore:
+            parts: List[Any] = [None] * len(coords)
+            if use_store or clipped:
+                for index, coord in enumerate(coords):
+                    for range_start, range_end in ranges:
+                        data, fresh = await RESPONSE_CACHE.aget(ResponseCache.make_key(HISTORY_API_BASE, {
+                            **params, "start_date": range_start.isoformat(), "end_date": range_end.isoformat(),
+                            "latitude": coord.latitude, "longitude": coord.longitude
+                        }))
+                        if fresh:
+                            CACHE_STATS["response_hits"] += 1
+                            parts[index] = data
+                            break
+                    if parts[index] is not None or not use_store:
+                        continue
+                    data = await asyncio.to_thread(WEATHER_STORE.read_range, coord, key, variables, fetch_start, fetch_end)
+                    if data is not None:
+                        CACHE_STATS["store_hits"] += 1
+                        await RESPONSE_CACHE.aput(ResponseCache.make_key(HISTORY_API_BASE, {
+                            **params, "latitude": coord.latitude, "longitude": coord.longitude
+                        }), data, cache_ttl)
+                        parts[index] = data
+                    else:
+                        CACHE_STATS["store_misses"] += 1
+
+            missing = [index for index, part in enumerate(parts) if part is None]
+            fetched = await fetch_packed(HISTORY_API_BASE, params, [coords[i] for i in missing], "history", cache_ttl)
+            for index, part in zip(missing, fetched):
+                parts[index] = part
+
+        # Store writes run after the semaphore is released and off the response path; the fetched months are
+        # already in RESPONSE_CACHE, and the shutdown drain waits for the task
+        writes = [(coords[index], parts[index]) for index in missing if use_store and isinstance(parts[index], dict)]
+        if writes:
+            task = asyncio.ensure_future(
+                asyncio.get_running_loop().run_in_executor(STORE_WRITER, store_chunk, writes, fetch_start, fetch_end)
+            )
+            _BACKGROUND_TASKS.add(task)
+            task.add_done_callback(_BACKGROUND_TASKS.discard)
+        return parts
+
+    def store_chunk(writes: List[Tuple[Coordinate, Dict[str, Any]]], chunk_start: date, chunk_end: date) -> None:
+        for coord, part in writes:
+            WEATHER_STORE.write_range(coord, key, chunk_start, chunk_end, part)
+
+    chunks = month_chunks(start, end)
+    log_sampled(logging.INFO, "Fetching history %s..%s for %d location(s) as %d chunk(s)", start, end, len(coords), len(chunks))
+    per_chunk = await asyncio.gather(*(fetch_chunk(chunk_start, chunk_end) for chunk_start, chunk_end in chunks))
+
+    results: List[Any] = []
+    for index in range(len(coords)):
+        parts = [chunk_results[index] for chunk_results in per_chunk]
+        failed = next((part for part in parts if isinstance(part, Exception)), None)
+        results.append(failed if failed is not None else stitch_chunks(parts, key, start, end))
+    return results
+
+
+async def fetch_history_chunked(
+    coord: Coordinate,
+    start: date,
+    end: date,
+    key: str,
+    param_vars: str
+) -> Dict[str, Any]:
+    """
+    Single-location fetch_history_many that raises the upstream error instead of returning it.
+    """
+    result = (await fetch_history_many([coord], start, end, key, param_vars))[0]
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+# ----------------------------------------------------------------------------------------------------------------------
+# VARIABLE LISTS (from Open-Meteo docs) - Double-check these are correct for your needs
+# ----------------------------------------------------------------------------------------------------------------------
+
+DEFAULT_HOURLY_VARS: List[str] = [
+    "temperature_2m", "relative_humidity_2m", "dew_point_2m", "apparent_temperature",
+    "precipitation", "rain", "snowfall", "snow_depth", "weather_code",
+    "pressure_msl", "cloud_cover", "shortwave_radiation", "direct_radiation",
+    "diffuse_radiation", "uv_index"
+]
+DEFAULT_DAILY_VARS: List[str] = [
+    "weather_code", "temperature_2m_max", "temperature_2m_min", "apparent_temperature_max", "apparent_temperature_min",
+    "sunrise", "sunset", "daylight_duration", "sunshine_duration",
+    "precipitation_sum", "rain_sum", "snowfall_sum", "precipitation_hours",
+    "uv_index_max", "wind_speed_10m_max", "wind_gusts_10m_max"
+]
+
+# ----------------------------------------------------------------------------------------------------------------------
+# COLUMNAR OUTPUT
+# ----------------------------------------------------------------------------------------------------------------------
+
+TIME_BLOCKS = ("minutely_15", "hourly", "daily")
+_last_output_prune = 0.0
+
+
+def check_output_format(output_format: str) -> None:
+    """
+    Raise ValueError if `output_format` is unknown or its optional dependency is missing.
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unsupported output_format: '{output_format}'. Use one of: {', '.join(OUTPUT_FORMATS)}.")
+    if output_format != "json" and np is None:
+        raise ValueError(f"output_format '{output_format}' requires numpy to be installed.")
+    if output_format in ("arrow", "parquet") and pa is None:
+        raise ValueError(f"output_format '{output_format}' requires pyarrow to be installed.")
+
+
+def _local_times_to_epoch(values: List[Any], utc_offset_seconds: int) -> "np.ndarray":
+    # Open-Meteo returns local ISO times ("YYYY-MM-DDTHH:MM" or "YYYY-MM-DD") for the response's timezone
+    return np.array(values, dtype="datetime64[m]").astype(np.int64) * 60 - utc_offset_seconds
+
+
+def to_columns(data: Dict[str, Any]) -> Dict[str, Dict[str, "np.ndarray"]]:
+    """
+    Convert the time blocks of an Open-Meteo payload into typed NumPy columns. Times (including time-valued
+    variables such as sunrise/sunset) become int64 Unix epoch seconds; other variables float64 with NaN for nulls.
+    """
+    offset = int(data.get("utc_offset_seconds", 0))
+    blocks: Dict[str, Dict[str, "np.ndarray"]] = {}
+    for block in TIME_BLOCKS:
+        if block not in data:
+            continue
+        columns: Dict[str, "np.ndarray"] = {}
+        for name, values in data[block].items():
+            if name == "time":
+                columns[name] = _local_times_to_epoch(values, offset)
+                continue
+            try:
+                columns[name] = np.array(values, dtype=np.float64)
+            except (TypeError, ValueError):
+                try:
+                    columns[name] = _local_times_to_epoch(values, offset)
+                except (TypeError, ValueError):
+                    columns[name] = np.array(values, dtype=str)
+        blocks[block] = columns
+    return blocks
+
+
+def _output_path(name: str, suffix: str) -> str:
+    global _last_output_prune
+    # Result files may hold data other users asked for; they live under the server's own .cache/ (not a shared
+    # temp directory another user could have created first) in a directory private to the server's user
+    os.makedirs(OUTPUT_DIR, mode=0o700, exist_ok=True)
+    now = time.time()
+    if now - _last_output_prune > 600:
+        _last_output_prune = now
+        for entry in os.scandir(OUTPUT_DIR):
+            try:
+                if entry.is_file() and now - entry.stat().st_mtime > OUTPUT_MAX_AGE:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                # Already pruned by another worker or thread
+                pass
+    return os.path.join(OUTPUT_DIR, f"{name}{suffix}")
+
+
+def render_output(data: Dict[str, Any], output_format: str, kind: str) -> Dict[str, Any]:
+    """
+    Shape a successful payload for the requested output_format. `json` returns it unchanged; the columnar
+    formats return metadata plus either inline typed columns (small numpy results) or file references.
+    """
+    if output_format == "json":
+        return data
+
+    blocks = to_columns(data)
+    result: Dict[str, Any] = {name: value for name, value in data.items() if name not in TIME_BLOCKS}
+    result["format"] = output_format
+    result["time_encoding"] = "unix_epoch_seconds"
+    result["schema"] = {
+        block: {"rows": len(columns.get("time", [])), "columns": {name: str(arr.dtype) for name, arr in columns.items()}}
+        for block, columns in blocks.items()
+    }
+    total_values = sum(arr.size for columns in blocks.values() for arr in columns.values())
+    name = f"{kind}_{uuid.uuid4().hex}"
+
+    if output_format == "numpy":
+        if total_values <= OUTPUT_INLINE_MAX_VALUES:
+            result["columns"] = {
+                block: {col: [None if v != v else v for v in arr.tolist()] if arr.dtype.kind == "f" else arr.tolist()
+                        for col, arr in columns.items()}
+                for block, columns in blocks.items()
+            }
+            return result
+        path = _output_path(name, ".npz")
+        np.savez(path, **{f"{block}.{col}": arr for block, columns in blocks.items() for col, arr in columns.items()})
+        result["files"] = {block: path for block in blocks}
+        return result
+
+    result["files"] = {}
+    for block, columns in blocks.items():
+        table = pa.table(columns)
+        if output_format == "parquet":
+            path = _output_path(f"{name}_{block}", ".parquet")
+            pq.write_table(table, path)
+        else:
+            path = _output_path(f"{name}_{block}", ".arrow")
+            with pa.OSFile(path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        result["files"][block] = path
+    return result
+
+# ----------------------------------------------------------------------------------------------------------------------
+# STREAMING TRANSPORT
+# ----------------------------------------------------------------------------------------------------------------------
+
+class _Column:
+    """
+    Sink for one streamed variable: compact float64 storage (NaN for null) until a non-numeric value shows up.
+    """
+    __slots__ = ("values",)
+
+    def __init__(self):
+        self.values: Any = array("d")
+
+    def append(self, value: Any) -> None:
+        if isinstance(self.values, array):
+            if value is None:
+                self.values.append(float("nan"))
+                return
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                self.values.append(value)
+                return
+            self.values = [None if v != v else v for v in self.values]
+        self.values.append(value)
+
+
+class _StreamReader:
+    """
+    Async file-like adapter over an httpx streaming response, as expected by ijson.
+    """
+
+    def __init__(self, resp: httpx.Response):
+        self._chunks = resp.aiter_bytes()
+
+    async def read(self, size: int = -1) -> bytes:
+        if size == 0:
+            return b""
+        try:
+            return await self._chunks.__anext__()
+        except StopAsyncIteration:
+            return b""
+
+
+async def _parse_stream(resp: httpx.Response) -> Any:
+    """
+    Build the payload from ijson events while the body arrives. Variable arrays inside time blocks go
+    straight into _Column sinks, so neither the raw body nor per-value float objects are held in memory.
+    """
+    stack: List[Any] = []                  # open containers
+    names: List[Optional[str]] = []        # key each open container will be stored under in its parent
+    key: Optional[str] = None
+    root: Any = None
+    async for event, value in ijson.basic_parse_async(_StreamReader(resp), use_float=True):
+        if event == "map_key":
+            key = value
+        elif event in ("start_map", "start_array"):
+            in_dict = bool(stack) and isinstance(stack[-1], dict)
+            if event == "start_map":
+                container: Any = {}
+            elif in_dict and names[-1] in TIME_BLOCKS and key != "time":
+                container = _Column()
+            else:
+                container = []
+            stack.append(container)
+            names.append(key if in_dict else None)
+        elif event in ("end_map", "end_array"):
+            container = stack.pop()
+            name = names.pop()
+            finished = container.values if isinstance(container, _Column) else container
+            if not stack:
+                root = finished
+            elif isinstance(stack[-1], dict):
+                stack[-1][name] = finished
+            else:
+                stack[-1].append(finished)
+        elif isinstance(stack[-1], dict):
+            stack[-1][key] = value
+        else:
+            stack[-1].append(value)
+    return root
+
+
+async def stream_json(url: str, params: Dict[str, Any], count_key: str) -> Dict[str, Any]:
+    """
+    HTTP GET that parses the body incrementally (requires ijson; falls back to a buffered parse without it).
+    Numeric time-block columns are returned as array("d"); use plain_payload() before returning them as JSON.
+    Responses are not cached, so peak memory is bounded by the requested range.
+    """
+    host = urlsplit(url).netloc or url
+    API_CALLS[count_key] += 1
+    log_sampled(logging.INFO, "Initiating streamed %s API call #%d to %s with params: %s", count_key, API_CALLS[count_key], url, params)
+
+    async def stream_once() -> Dict[str, Any]:
+        async with SCHEDULER.slot(url):
+            # Body download and parsing overlap, so both count as json_decode once the headers are in
+            started = time.perf_counter()
+            async with get_http_client().stream("GET", url, params=params) as resp:
+                METRICS.observe("upstream", time.perf_counter() - started, host)
+                if resp.is_error:
+                    METRICS.count("http_errors")
+                    await resp.aread()
+                    resp.raise_for_status()
+                with METRICS.timed("json_decode", host):
+                    if ijson is None:
+                        return json.loads(await resp.aread())
+                    return await _parse_stream(resp)
+
+    # Same retry policy as buffered requests: network errors and HTTP 429/5xx, with exponential backoff
+    backoff = 1
+    for attempt in range(PACKET_RETRIES):
+        try:
+            return await stream_once()
+        except httpx.RequestError as req_err:
+            METRICS.count("timeouts" if isinstance(req_err, httpx.TimeoutException) else "network_errors")
+            logger.warning("%s streamed request error attempt %d: %s", count_key, attempt + 1, req_err)
+        except httpx.HTTPStatusError as st_err:
+            status = st_err.response.status_code
+            if status != 429 and status < 500:
+                raise
+            logger.warning("%s streamed request failed with HTTP %d, retrying", count_key, status)
+        METRICS.count("retries")
+        await asyncio.sleep(backoff)
+        backoff *= 2
+    # Final attempt
+    return await stream_once()
+
+
+def plain_payload(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Copy of a streamed payload with compact columns turned back into JSON lists (NaN -> None).
+    """
+    result = dict(data)
+    for block in TIME_BLOCKS:
+        if block in result:
+            result[block] = {
+                name: [None if v != v else v for v in values] if isinstance(values, array) else values
+                for name, values in result[block].items()
+            }
+    return result
+
+
+async def fetch_history_page(
+    coord: Coordinate,
+    start: date,
+    end: date,
+    key: str,
+    param_vars: str
+) -> Dict[str, Any]:
+    """
+    Fetch start..end one month chunk at a time through the streaming transport, serving final months from
+    the local store and writing fetched final months through to it.
+    """
+    variables = [variable.strip() for variable in param_vars.split(",") if variable.strip()]
+    parts: List[Dict[str, Any]] = []
+    for chunk_start, chunk_end in month_chunks(start, end):
+        chunk_start, chunk_end = fetch_range(chunk_start, chunk_end, start, end)
+        use_store = history_cache_ttl(chunk_end) == float("inf")
+        part = None
+        if use_store:
+            part = await asyncio.to_thread(WEATHER_STORE.read_range, coord, key, variables, chunk_start, chunk_end)
+            CACHE_STATS["store_hits" if part is not None else "store_misses"] += 1
+        if part is None:
+            params = {
+                "latitude": coord.latitude, "longitude": coord.longitude,
+                "start_date": chunk_start.isoformat(), "end_date": chunk_end.isoformat(),
+                "timezone": TIMEZONE, key: param_vars
+            }
+            part = await stream_json(HISTORY_API_BASE, params, "history")
+            if use_store:
+                await asyncio.get_running_loop().run_in_executor(
+                    STORE_WRITER, WEATHER_STORE.write_range, coord, key, chunk_start, chunk_end, part
+                )
+        parts.append(part)
+    return stitch_chunks(parts, key, start, end)
+
+# ----------------------------------------------------------------------------------------------------------------------
+# RESAMPLING
+# ----------------------------------------------------------------------------------------------------------------------
+
+# Partial aggregates (sum/count/min/max per bucket) of whole archive months, keyed like the month's archive request
+# plus the variable and interval, so overlapping resampled requests only aggregate the months they do not share
+AGGREGATE_CACHE = ResponseCache(max_entries=AGGREGATE_CACHE_MAX_ENTRIES)
+_RESAMPLE_UNITS = {"h": "hour", "d": "day", "w": "week", "M": "month"}
+
+
+def parse_resample(resample: str, aggregate: str) -> Tuple[int, str, List[str]]:
+    """
+    Validate a resample interval ("3h", "1d", "1w", "1M", ...) and the comma-separated reducers.
+    Returns (count, unit, reducers). Raises ValueError.
+    """
+    if np is None:
+        raise ValueError("resample requires numpy to be installed.")
+    match = re.fullmatch(r"(\d*)([hdwM])", resample.strip())
+    count = int(match.group(1) or 1) if match else 0
+    if count < 1:
+        raise ValueError(f"Invalid resample interval: '{resample}'. Use <n><unit> with unit h (hours), d (days), "
+                         f"w (weeks, starting on Monday) or M (calendar months), e.g. '3h', '1d', '1w', '1M'.")
+    reducers: List[str] = []
+    for reducer in (name.strip() for name in aggregate.split(",")):
+        percentile = re.fullmatch(r"p(\d{1,2}(\.\d+)?|100)", reducer)
+        if reducer not in AGGREGATE_REDUCERS and percentile is None:
+            raise ValueError(f"Unsupported aggregate: '{reducer}'. Use {', '.join(AGGREGATE_REDUCERS)} or a percentile such as p95.")
+        if reducer not in reducers:
+            reducers.append(reducer)
+    return count, match.group(2), reducers
+
+
+def bucket_ids(times: Sequence[str], count: int, unit: str) -> "np.ndarray":
+    """
+    Absolute bucket number of each local ISO time, so buckets line up across requests and month chunks.
+    """
+    minutes = np.array(times, dtype="datetime64[m]").astype(np.int64)
+    if unit == "h":
+        return minutes // (60 * count)
+    days = minutes // 1440
+    if unit == "d":
+        return days // count
+    if unit == "w":
+        return (days + 3) // (7 * count)  # 1970-01-01 was a Thursday
+    return minutes.astype("datetime64[m]").astype("datetime64[M]").astype(np.int64) // count
+
+
+def bucket_labels(ids: "np.ndarray", count: int, unit: str) -> List[str]:
+    """
+    Local start time of each bucket, formatted like Open-Meteo's time column.
+    """
+    if unit == "h":
+        return np.datetime_as_string((ids * 60 * count).astype("datetime64[m]")).tolist()
+    if unit == "d":
+        starts = (ids * count).astype("datetime64[D]")
+    elif unit == "w":
+        starts = (ids * 7 * count - 3).astype("datetime64[D]")
+    else:
+        starts = (ids * count).astype("datetime64[M]").astype("datetime64[D]")
+    return np.datetime_as_string(starts).tolist()
+
+
+def _bucket_starts(ids: "np.ndarray") -> "np.ndarray":
+    # ids are non-decreasing (rows are in time order); index of the first row of each bucket
+    return np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+
+
+def partial_aggregates(ids: "np.ndarray", values: "np.ndarray") -> Dict[str, "np.ndarray"]:
+    """
+    Mergeable per-bucket sum/count/min/max of `values`, ignoring NaNs.
+    """
+    if ids.size == 0:
+        return {"ids": ids, "sum": values, "count": ids, "min": values, "max": values}
+    starts = _bucket_starts(ids)
+    valid = ~np.isnan(values)
+    return {
+        "ids": ids[starts],
+        "sum": np.add.reduceat(np.where(valid, values, 0.0), starts),
+        "count": np.add.reduceat(valid.astype(np.int64), starts),
+        "min": np.minimum.reduceat(np.where(valid, values, np.inf), starts),
+        "max": np.maximum.reduceat(np.where(valid, values, -np.inf), starts),
+    }
+
+
+def merge_partials(parts: List[Dict[str, "np.ndarray"]]) -> Dict[str, "np.ndarray"]:
+    """
+    Combine partial aggregates of consecutive time ranges; a bucket split between ranges is merged.
+    """
+    joined = {name: np.concatenate([part[name] for part in parts]) for name in ("ids", "sum", "count", "min", "max")}
+    if joined["ids"].size == 0:
+        return joined
+    starts = _bucket_starts(joined["ids"])
+    return {
+        "ids": joined["ids"][starts],
+        "sum": np.add.reduceat(joined["sum"], starts),
+        "count": np.add.reduceat(joined["count"], starts),
+        "min": np.minimum.reduceat(joined["min"], starts),
+        "max": np.maximum.reduceat(joined["max"], starts),
+    }
+
+
+def finish_aggregates(partials: Dict[str, "np.ndarray"], reducers: List[str]) -> Dict[str, "np.ndarray"]:
+    """
+    Turn partial aggregates into the requested (non-percentile) reducers; empty buckets become NaN.
+    """
+    empty = partials["count"] == 0
+    results: Dict[str, "np.ndarray"] = {}
+    for reducer in reducers:
+        if reducer == "mean":
+            results[reducer] = np.divide(partials["sum"], partials["count"], out=np.full(empty.shape, np.nan), where=~empty)
+        elif reducer == "count":
+            results[reducer] = partials["count"].astype(np.float64)
+        else:
+            results[reducer] = np.where(empty, np.nan, partials[reducer])
+    return results
+
+
+def bucket_percentiles(ids: "np.ndarray", values: "np.ndarray", quantiles: List[float]) -> List["np.ndarray"]:
+    """
+    Per-bucket percentiles (linear interpolation, NaNs ignored) computed with one sort over all buckets.
+    """
+    order = np.lexsort((values, ids))  # NaNs sort last within each bucket
+    ids, values = ids[order], values[order]
+    starts = _bucket_starts(ids)
+    counts = np.add.reduceat((~np.isnan(values)).astype(np.int64), starts)
+    results = []
+    for q in quantiles:
+        position = starts + q / 100 * np.maximum(counts - 1, 0)
+        lo = np.floor(position).astype(np.int64)
+        hi = np.ceil(position).astype(np.int64)
+        result = values[lo] + (values[hi] - values[lo]) * (position - lo)
+        results.append(np.where(counts == 0, np.nan, result))
+    return results
+
+
+def _numeric(values: Any) -> Optional["np.ndarray"]:
+    # Time-valued and textual variables (e.g. sunrise) cannot be aggregated
+    try:
+        return np.asarray(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        return None
+
+
+def _json_column(arr: "np.ndarray") -> List[Optional[float]]:
+    return [None if v != v else v for v in arr.tolist()]
+
+
+def resample_block(
+    columns: Dict[str, Any],
+    units: Dict[str, str],
+    count: int,
+    unit: str,
+    reducers: List[str]
+) -> Tuple[Dict[str, List[Any]], Dict[str, str], List[str]]:
+    """
+    Resample one time block ({"time": [...], variable: [...]}) from its raw values.
+    Returns (block, units, skipped variables); output columns are named "<variable>_<reducer>".
+    """
+    ids = bucket_ids(columns.get("time", []), count, unit)
+    starts = _bucket_starts(ids) if ids.size else ids
+    block: Dict[str, List[Any]] = {"time": bucket_labels(ids[starts], count, unit)}
+    block_units: Dict[str, str] = {"time": units.get("time", "iso8601")}
+    skipped: List[str] = []
+    percentiles = [reducer for reducer in reducers if reducer not in AGGREGATE_REDUCERS]
+    for name, values in columns.items():
+        if name == "time":
+            continue
+        numeric = _numeric(values)
+        if numeric is None:
+            skipped.append(name)
+            continue
+        results = finish_aggregates(partial_aggregates(ids, numeric), [r for r in reducers if r in AGGREGATE_REDUCERS])
+        if percentiles and ids.size:
+            results.update(zip(percentiles, bucket_percentiles(ids, numeric, [float(p[1:]) for p in percentiles])))
+        for reducer in reducers:
+            column = results.get(reducer, np.full(len(block["time"]), np.nan))
+            block[f"{name}_{reducer}"] = _json_column(column)
+            block_units[f"{name}_{reducer}"] = "count" if reducer == "count" else units.get(name, "")
+    return block, block_units, skipped
+
+
+def resample_payload(data: Dict[str, Any], count: int, unit: str, reducers: List[str]) -> Dict[str, Any]:
+    """
+    Copy of an Open-Meteo payload with every time block resampled into `count` `unit` buckets.
+    """
+    result = {name: value for name, value in data.items() if name not in TIME_BLOCKS}
+    skipped: List[str] = []
+    for block in TIME_BLOCKS:
+        if block in data:
+            result[block], result[f"{block}_units"], block_skipped = resample_block(
+                data[block], data.get(f"{block}_units", {}), count, unit, reducers
+            )
+            skipped += block_skipped
+    result["resample"] = {"interval": f"{count}{unit}", "aggregate": reducers, "skipped": skipped}
+    return result
+
+
+async def fetch_history_resampled(
+    coord: Coordinate,
+    start: date,
+    end: date,
+    key: str,
+    param_vars: str,
+    count: int,
+    unit: str,
+    reducers: List[str]
+) -> Dict[str, Any]:
+    """
+    Resampled get_history. Mean/min/max/sum/count are built from per-month partial aggregates: whole months
+    already aggregated for this location, variable and interval come from AGGREGATE_CACHE, only the remaining
+    months are fetched (via fetch_history_chunked, so from the cache/store where possible) and aggregated.
+    Percentiles need every raw value and are computed over the full fetched range.
+    """
+    if any(reducer not in AGGREGATE_REDUCERS for reducer in reducers):
+        data = await fetch_history_chunked(coord, start, end, key, param_vars)
+        with METRICS.timed("resample"):
+            return await asyncio.to_thread(resample_payload, data, count, unit, reducers)
+
+    variables = [variable.strip() for variable in param_vars.split(",") if variable.strip()]
+    interval = f"{count}{unit}"
+
+    def cache_key(chunk_start: date, chunk_end: date, variable: str) -> str:
+        return ResponseCache.make_key(HISTORY_API_BASE, {
+            "latitude": coord.latitude, "longitude": coord.longitude, "timezone": TIMEZONE,
+            "start_date": chunk_start.isoformat(), "end_date": chunk_end.isoformat(), key: variable, "resample": interval
+        })
+
+    # Segments are the month chunks clipped to the request; only unclipped (whole) chunks are cached
+    chunks = month_chunks(start, end)
+    segments = [(max(chunk_start, start), min(chunk_end, end)) for chunk_start, chunk_end in chunks]
+    whole = [segment == chunk for segment, chunk in zip(segments, chunks)]
+    cached: List[Optional[Dict[str, Any]]] = []
+    for (segment_start, segment_end), is_whole in zip(segments, whole):
+        entries = None
+        if is_whole:
+            entries = {variable: AGGREGATE_CACHE.get(cache_key(segment_start, segment_end, variable))[0]
+                       for variable in ["", *variables]}
+            if any(entry is None for entry in entries.values()):
+                entries = None
+        CACHE_STATS["aggregate_hits" if entries is not None else "aggregate_misses"] += 1
+        cached.append(entries)
+
+    # Fetch each run of consecutive uncached segments as one range
+    runs: List[List[int]] = []
+    for index, entries in enumerate(cached):
+        if entries is None:
+            if runs and runs[-1][-1] == index - 1:
+                runs[-1].append(index)
+            else:
+                runs.append([index])
+    fetched = await asyncio.gather(*(
+        fetch_history_chunked(coord, segments[run[0]][0], segments[run[-1]][1], key, param_vars) for run in runs
+    ))
+
+    def aggregate() -> Dict[str, Any]:
+        for run, data in zip(runs, fetched):
+            columns = data.get(key, {})
+            times = columns.get("time", [])
+            units = data.get(f"{key}_units", {})
+            meta = {name: value for name, value in data.items() if name not in (key, f"{key}_units", "generationtime_ms")}
+            for index in run:
+                segment_start, segment_end = segments[index]
+                lo = bisect_left(times, segment_start.isoformat())
+                hi = bisect_right(times, segment_end.isoformat() + "\uffff")
+                ids = bucket_ids(times[lo:hi], count, unit)
+                entries: Dict[str, Any] = {"": {"meta": meta, "time_unit": units.get("time", "iso8601")}}
+                for variable in variables:
+                    numeric = _numeric(columns[variable][lo:hi]) if variable in columns else None
+                    entries[variable] = {"unit": units.get(variable, ""), "partials": None if numeric is None
+                                         else partial_aggregates(ids, numeric)}
+                cached[index] = entries
+                if whole[index]:
+                    ttl = history_cache_ttl(segment_end)
+                    for variable, entry in entries.items():
+                        AGGREGATE_CACHE.put(cache_key(segment_start, segment_end, variable), entry, ttl)
+
+        header = cached[0][""]
+        block: Dict[str, List[Any]] = {}
+        block_units: Dict[str, str] = {"time": header["time_unit"]}
+        skipped: List[str] = []
+        for variable in variables:
+            parts = [entries[variable]["partials"] for entries in cached]
+            if any(part is None for part in parts):
+                skipped.append(variable)
+                continue
+            merged = merge_partials(parts)
+            block.setdefault("time", bucket_labels(merged["ids"], count, unit))
+            for reducer, column in finish_aggregates(merged, reducers).items():
+                block[f"{variable}_{reducer}"] = _json_column(column)
+                block_units[f"{variable}_{reducer}"] = "count" if reducer == "count" else cached[0][variable]["unit"]
+        block.setdefault("time", [])
+        return {
+            **header["meta"], key: {"time": block.pop("time"), **block}, f"{key}_units": block_units,
+            "resample": {"interval": interval, "aggregate": reducers, "skipped": skipped}
+        }
+
+    with METRICS.timed("resample"):
+        return await asyncio.to_thread(aggregate)
+
+# ----------------------------------------------------------------------------------------------------------------------
+# REQUEST BUILDING
+# ----------------------------------------------------------------------------------------------------------------------
+
+async def resolve_coordinate(
+    place: Optional[str],
+    latitude: Optional[float],
+    longitude: Optional[float]
+) -> Coordinate:
+    """
+    Turn a place name or a latitude/longitude pair into a validated Coordinate. Raises ValueError.
+    """
+    if place:
+        with METRICS.timed("geocode"):
+            latitude, longitude = await get_coordinates(place)
+        if latitude is None or longitude is None:
+            raise ValueError(f"Could not geocode '{place}'.")
+
+    if latitude is None or longitude is None:
+        raise ValueError("Either 'place' or both 'latitude' and 'longitude' must be provided.")
+
+    try:
+        return Coordinate(latitude=latitude, longitude=longitude)
+    except ValidationError as e:
+        logger.warning(f"Coordinate validation failed: {e.errors()}")
+        raise ValueError(f"Invalid coordinates: {e.errors()}")
+
+
+async def resolve_locations(
+    places: Optional[List[str]],
+    latitudes: Optional[List[float]],
+    longitudes: Optional[List[float]]
+) -> List[Tuple[Dict[str, Any], Any]]:
+    """
+    Resolve batch tool locations concurrently (geocoding is paced by SCHEDULER).
+    Returns (label, Coordinate or error message) per location, places first.
+    """
+    places = places or []
+    latitudes = latitudes or []
+    longitudes = longitudes or []
+    if len(latitudes) != len(longitudes):
+        raise ValueError("'latitudes' and 'longitudes' must have the same length.")
+    if not places and not latitudes:
+        raise ValueError("Provide 'places' and/or 'latitudes'/'longitudes'.")
+    if len(places) + len(latitudes) > BATCH_MAX_SITES:
+        raise ValueError(f"Too many locations: at most {BATCH_MAX_SITES} per call.")
+
+    labels: List[Dict[str, Any]] = [{"place": place} for place in places]
+    labels += [{"latitude": lat, "longitude": lon} for lat, lon in zip(latitudes, longitudes)]
+
+    async def resolve(label: Dict[str, Any]) -> Any:
+        try:
+            return await resolve_coordinate(label.get("place"), label.get("latitude"), label.get("longitude"))
+        except ValueError as e:
+            return str(e)
+
+    def location_key(label: Dict[str, Any]) -> Any:
+        if "place" in label:
+            return GeocodeCache.normalize(label["place"])
+        return label["latitude"], label["longitude"]
+
+    # Repeated locations are resolved once
+    unique: Dict[Any, Dict[str, Any]] = {}
+    for label in labels:
+        unique.setdefault(location_key(label), label)
+    resolved = dict(zip(unique, await asyncio.gather(*(resolve(label) for label in unique.values()))))
+    return [(label, resolved[location_key(label)]) for label in labels]
+
+
+def build_forecast_params(
+    granularity: int,
+    forecast_days: Optional[int],
+    past_days: Optional[int],
+    variables: Optional[str],
+    daily_variables: Optional[str]
+) -> Dict[str, Any]:
+    """
+    Forecast API parameters shared by all locations of a request (everything except latitude/longitude).
+    Raises ValueError for an unsupported granularity.
+    """
+    params: Dict[str, Any] = {"timezone": TIMEZONE}
+
+    # Handle primary variables based on granularity
+    if granularity == 15:
+        key = "minutely_15"; default_vars = DEFAULT_HOURLY_VARS 
+        params[key] = variables or ",".join(default_vars)
+    elif granularity == 60:
+        key = "hourly"; default_vars = DEFAULT_HOURLY_VARS
+        params[key] = variables or ",".join(default_vars)
+    elif granularity >= 1440:
+        # If granularity is daily, primary request is daily
+        key = "daily"; default_vars = DEFAULT_DAILY_VARS
+        # Prioritize explicit daily_variables if provided for daily granularity
+        params[key] = daily_variables or variables or ",".join(default_vars)
+    else:
+        raise ValueError(f"Unsupported granularity: {granularity}. Use 15, 60, or >=1440.")
+
+    # Add explicitly requested daily variables, regardless of main granularity
+    if daily_variables:
+         params["daily"] = daily_variables
+    # If granularity is daily, ensure the 'daily' key is set (might have been done above)
+    elif granularity >= 1440 and "daily" not in params:
+         # This handles the case where granularity is daily, but neither 'daily_variables' nor 'variables' were provided
+         params["daily"] = ",".join(DEFAULT_DAILY_VARS)
+
+    # Handle forecast_days and past_days
+    # Set default forecast days only if neither forecast nor past days are specified.
+    add_default_forecast = True
+    if forecast_days is not None and forecast_days > 0:
+         params["forecast_days"] = min(forecast_days, 16) # API limit is 16
+         add_default_forecast = False # User specified forecast days
+
+    if past_days is not None and past_days > 0:
+        # Let the API handle the upper limit for past_days as it varies.
+        params["past_days"] = past_days
+        add_default_forecast = False # User specified past days
+
+    # Add default forecast days if no forecast/past days were specified
+    if add_default_forecast:
+        params["forecast_days"] = DEFAULT_FORECAST_DAYS
+
+    return params
+
+
+def build_history_request(
+    start_date: Optional[str],
+    end_date: Optional[str],
+    granularity: int,
+    variables: Optional[str]
+) -> Tuple[date, date, str, str]:
+    """
+    Validate history dates and granularity; returns (start, end, block key, variables). Raises ValueError.
+    """
+    # ** Check for required dates **
+    if not start_date or not end_date:
+         raise ValueError("The 'start_date' and 'end_date' parameters (in YYYY-MM-DD format) are required for retrieving historical weather data. Please provide the specific past date or date range.")
+
+    try:
+        sd = date.fromisoformat(start_date)
+        ed = date.fromisoformat(end_date)
+        if sd > ed: raise ValueError("start_date must be less than or equal to end_date")
+    except ValueError as date_err:
+        raise ValueError(f"Invalid date format or range: {date_err}. Use YYYY-MM-DD format for start_date and end_date.")
+
+    if granularity == 60:
+        key = "hourly"; param_vars = variables or ",".join(DEFAULT_HOURLY_VARS)
+    elif granularity >= 1440:
+        key = "daily"; param_vars = variables or ",".join(DEFAULT_DAILY_VARS)
+    else: # Explicitly forbid 15 for history
+        raise ValueError(f"Unsupported granularity for history: {granularity}. Use 60 (hourly) or >=1440 (daily). 15-minute data is not available.")
+
+    return sd, ed, key, param_vars
+
+
+def render_outcomes(outcomes: List[Any], output_format: str, kind: str) -> List[Any]:
+    """
+    Apply render_output to the successful payloads of a batch, keeping errors as they are.
+    """
+    rendered: List[Any] = []
+    for outcome in outcomes:
+        if isinstance(outcome, dict):
+            try:
+                outcome = render_output(outcome, output_format, kind)
+            except Exception as err:
+                outcome = err
+        rendered.append(outcome)
+    return rendered
+
+
+def batch_response(labels: List[Dict[str, Any]], outcomes: List[Any], kind: str) -> Dict[str, Any]:
+    """
+    Combine per-location payloads, exceptions or error messages into a batch tool response.
+    """
+    results: List[Dict[str, Any]] = []
+    for label, outcome in zip(labels, outcomes):
+        if isinstance(outcome, Exception):
+            results.append({**label, "status": "error", "message": f"Failed to retrieve {kind}: {str(outcome)}"})
+        elif isinstance(outcome, str):
+            results.append({**label, "status": "error", "message": outcome})
+        else:
+            results.append({**label, "status": "success", "data": outcome})
+
+    failed = sum(1 for result in results if result["status"] == "error")
+    if failed == 0:
+        status = "success"
+    elif failed == len(results):
+        status = "error"
+    else:
+        status = "partial"
+    return {"status": status, "succeeded": len(results) - failed, "failed": failed, "results": results}
+
+# ----------------------------------------------------------------------------------------------------------------------
+# BACKGROUND PREFETCHING
+# ----------------------------------------------------------------------------------------------------------------------
+
+class LeaderLease:
+    """
+    Time-limited lease row in a shared SQLite file: of all processes contending for `name`, only the current
+    holder gets True from claim(). Methods are blocking; call them through asyncio.to_thread from async code.
+    """
+
+    def __init__(self, path: str, name: str, ttl: float = PREFETCH_LEASE_TTL):
+        self.path = path
+        self.name = name
+        self.ttl = ttl
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._conn = conn
+        return self._conn
+
+    def claim(self) -> bool:
+        """
+        Take or renew the lease if it is free, expired or already ours. Raises sqlite3.Error.
+        """
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            row = conn.execute("SELECT owner, expires_at FROM leases WHERE name = ?", (self.name,)).fetchone()
+            held = row is None or row[0] == self.owner or row[1] < now
+            if held:
+                conn.execute(
+                    "INSERT OR REPLACE INTO leases (name, owner, expires_at) VALUES (?, ?, ?)",
+                    (self.name, self.owner, now + self.ttl)
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        return held
+
+    def release(self) -> None:
+        try:
+            self._connect().execute("DELETE FROM leases WHERE name = ? AND owner = ?", (self.name, self.owner))
+        except sqlite3.Error as db_err:
+            logger.warning(f"Could not release lease '{self.name}': {db_err}")
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+class Prefetcher:
+    """
+    Keeps the watch list warm: refreshes forecasts shortly after each model update (so get_forecast for a
+    watched site is answered from RESPONSE_CACHE) and backfills settled archive days into WEATHER_STORE every night.
+    Entries sharing the same request parameters are packed into batch requests.
+    With a `lease` (several worker processes), only the lease holder runs the refreshes.
+    """
+
+    def __init__(self, path: str = WATCHLIST_PATH, lease: Optional[LeaderLease] = None):
+        self.path = path
+        self.lease = lease
+        self.entries: List[WatchEntry] = []
+        self._tasks: List["asyncio.Task[None]"] = []
+        self.stats: Dict[str, Any] = {
+            "watched": 0, "leader": lease is None, "forecast_runs": 0, "archive_runs": 0, "failures": 0,
+            "last_forecast_run": None, "last_archive_run": None
+        }
+
+    def load(self) -> List[WatchEntry]:
+        if not os.path.exists(self.path):
+            return []
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                entries = [WatchEntry(**raw) for raw in json.load(f)]
+        except (OSError, ValueError, TypeError) as err:
+            logger.error(f"Could not load watch list {self.path}: {err}")
+            return []
+        return entries
+
+    async def start(self) -> None:
+        self.entries = self.load()
+        self.stats["watched"] = len(self.entries)
+        if not self.entries:
+            logger.info("Prefetcher idle: no watch list entries.")
+            return
+        if self.lease is not None:
+            await self._claim_lease()
+            self._tasks.append(asyncio.create_task(self._lease_loop()))
+        logger.info(f"Prefetcher started for {len(self.entries)} watched location(s) "
+                    f"({'leader' if self.stats['leader'] else 'standby'}).")
+        self._tasks += [
+            asyncio.create_task(self._forecast_loop()),
+            asyncio.create_task(self._archive_loop()),
+        ]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self.lease is not None:
+            await asyncio.to_thread(self.lease.release)
+            self.stats["leader"] = False
+
+    async def _claim_lease(self) -> None:
+        try:
+            leader = await asyncio.to_thread(self.lease.claim)
+        except sqlite3.Error as db_err:
+            # Keep the current role; the next renewal tries again
+            logger.warning(f"Prefetch lease unavailable: {db_err}")
+            return
+        if leader != self.stats["leader"]:
+            logger.info(f"Prefetcher is now {'leader' if leader else 'standby'}.")
+        self.stats["leader"] = leader
+
+    async def _lease_loop(self) -> None:
+        # Renew well within the TTL; a standby takes over within one TTL after the leader stops renewing
+        while True:
+            await asyncio.sleep(self.lease.ttl / 3)
+            await self._claim_lease()
+
+    async def _resolve(self, entries: List[WatchEntry], dataset: str) -> List[Tuple[WatchEntry, Coordinate]]:
+        resolved: List[Tuple[WatchEntry, Coordinate]] = []
+        for entry in entries:
+            try:
+                coord = await resolve_coordinate(entry.place, entry.latitude, entry.longitude)
+                resolved.append((entry, snap_coordinate(coord, dataset)))
+            except ValueError as e:
+                self.stats["failures"] += 1
+                logger.warning(f"Prefetcher skipping watch entry {entry}: {e}")
+        return resolved
+
+    async def _run_groups(self, groups: Dict[Any, List[Coordinate]], fetch: Any) -> None:
+        semaphore = asyncio.Semaphore(PREFETCH_CONCURRENCY)
+
+        async def run(group_key: Any, coords: List[Coordinate]) -> None:
+            # Jitter so refreshes of different groups do not all hit the upstream at once
+            await asyncio.sleep(random.uniform(0, PREFETCH_JITTER))
+            async with semaphore:
+                outcomes = await fetch(group_key, coords)
+            self.stats["failures"] += sum(1 for outcome in outcomes if isinstance(outcome, Exception))
 
-# Initialize MCP server under the "weather" namespace
-mcp = FastMCP("weather")
+        await asyncio.gather(*(run(group_key, coords) for group_key, coords in groups.items()))
 
-# API endpoints
-FORECAST_API_BASE = "https://api.open-meteo.com/v1/forecast"
-HISTORY_API_BASE = "https://archive-api.open-meteo.com/v1/archive"
+    async def refresh_forecasts(self) -> None:
+        groups: Dict[Tuple[Tuple[str, Any], ...], List[Coordinate]] = {}
+        for entry, coord in await self._resolve(self.entries, "forecast"):
+            try:
+                params = build_forecast_params(
+                    entry.granularity, entry.forecast_days, entry.past_days, entry.variables, entry.daily_variables
+                )
+            except ValueError as e:
+                self.stats["failures"] += 1
+                logger.warning(f"Prefetcher skipping watch entry {entry}: {e}")
+                continue
+            groups.setdefault(tuple(sorted(params.items())), []).append(coord)
 
-# Defaults
-TIMEZONE = "auto"
-DEFAULT_TIMEOUT = 30.0  
-DEFAULT_FORECAST_DAYS = 7
-DEFAULT_PAST_DAYS = 0
+        async def fetch(group_key: Tuple[Tuple[str, Any], ...], coords: List[Coordinate]) -> List[Any]:
+            # Keep entries until the run after the next model update has had time to replace them
+            ttl = forecast_cache_ttl() + PREFETCH_JITTER + 60
+            return await fetch_packed(FORECAST_API_BASE, dict(group_key), coords, "forecast", ttl, refresh=True)
 
-# Counter for monitoring usage
-API_CALLS: Dict[str, int] = {"geocoding": 0, "forecast": 0, "history": 0}
+        await self._run_groups(groups, fetch)
+        self.stats["forecast_runs"] += 1
+        self.stats["last_forecast_run"] = datetime.now(timezone.utc).isoformat()
 
-# Reusable HTTP client 
-client = httpx.AsyncClient(timeout=DEFAULT_TIMEOUT)
+    async def append_archive(self) -> None:
+        """
+        Store archive days up to the settle window. Days newer than ARCHIVE_SETTLE_DAYS may still be revised
+        upstream, so they are not prefetched; get_history fetches them on demand with a short cache TTL.
+        """
+        end = date.today() - timedelta(days=ARCHIVE_SETTLE_DAYS + 1)
+        if history_cache_ttl(month_chunks(end, end)[-1][1]) != float("inf"):
+            # end's month is over but not settled as a whole month yet; it is stored once it is
+            end = end.replace(day=1) - timedelta(days=1)
+        # Month-aligned, so each night extends the same coverage rows that get_history chunks look up
+        start = (end - timedelta(days=PREFETCH_ARCHIVE_DAYS - 1)).replace(day=1)
+        groups: Dict[Tuple[str, str], List[Coordinate]] = {}
+        for entry, coord in await self._resolve([entry for entry in self.entries if entry.archive], "history"):
+            try:
+                _, _, key, param_vars = build_history_request(
+                    start.isoformat(), end.isoformat(), entry.granularity, entry.variables
+                )
+            except ValueError as e:
+                self.stats["failures"] += 1
+                logger.warning(f"Prefetcher skipping archive for watch entry {entry}: {e}")
+                continue
+            groups.setdefault((key, param_vars), []).append(coord)
+
+        async def fetch(group_key: Tuple[str, str], coords: List[Coordinate]) -> List[Any]:
+            return await fetch_history_many(coords, start, end, group_key[0], group_key[1])
+
+        await self._run_groups(groups, fetch)
+        self.stats["archive_runs"] += 1
+        self.stats["last_archive_run"] = datetime.now(timezone.utc).isoformat()
+
+    async def _forecast_loop(self) -> None:
+        while True:
+            try:
+                if self.stats["leader"]:
+                    await self.refresh_forecasts()
+            except Exception as err:
+                self.stats["failures"] += 1
+                logger.error(f"Forecast prefetch failed: {err}", exc_info=True)
+            # Wake up when the next model update has been published
+            await asyncio.sleep(forecast_cache_ttl())
+
+    async def _archive_loop(self) -> None:
+        while True:
+            try:
+                if self.stats["leader"]:
+                    await self.append_archive()
+            except Exception as err:
+                self.stats["failures"] += 1
+                logger.error(f"Archive prefetch failed: {err}", exc_info=True)
+            now = datetime.now(timezone.utc)
+            next_run = now.replace(hour=PREFETCH_ARCHIVE_HOUR_UTC, minute=0, second=0, microsecond=0)
+            if next_run <= now:
+                next_run += timedelta(days=1)
+            await asyncio.sleep((next_run - now).total_seconds() + random.uniform(0, PREFETCH_JITTER))
+
+
+PREFETCHER = Prefetcher()
 
 # ----------------------------------------------------------------------------------------------------------------------
-# DATA MODELS & VALIDATION
+# SERVER LIFESPAN
 # ----------------------------------------------------------------------------------------------------------------------
 
-class Coordinate(BaseModel):
+_runtime_users = 0
+_runtime_lock = asyncio.Lock()
+
+
+async def _release_runtime() -> None:
+    logger.info("Releasing server resources...")
+    await PREFETCHER.stop()
+    # Drain: let in-flight tool calls and background cache refreshes finish before their resources go away
+    started = time.monotonic()
+    if not await ACTIVE_CALLS.drain(DRAIN_TIMEOUT):
+        logger.warning(f"{ACTIVE_CALLS.active} tool call(s) still running after {DRAIN_TIMEOUT}s; shutting down anyway.")
+    remaining = max(0.0, DRAIN_TIMEOUT - (time.monotonic() - started))
+    if _BACKGROUND_TASKS:
+        await asyncio.wait(list(_BACKGROUND_TASKS), timeout=remaining)
+    try:
+        await close_http_client()
+        await close_geocoder()
+        GEOCODE_CACHE.close()
+        WEATHER_STORE.close()
+        RESPONSE_CACHE.close()
+        SCHEDULER.close()
+        logger.info("Server resources released.")
+    except Exception as close_err:
+        # Log errors during cleanup, but don't crash the exit process
+        logger.error(f"Error during resource cleanup: {close_err}", exc_info=True)
+
+
+@asynccontextmanager
+async def server_runtime() -> AsyncIterator[None]:
     """
-    Model: Geographic coordinates validator
+    Reference-counted process runtime: the first holder starts the HTTP client and background work, the last
+    one drains in-flight calls (up to DRAIN_TIMEOUT) and releases everything, including the geocoder session
+    and SQLite handles. The HTTP transports hold it for the whole process, so per-session lifespans are cheap.
     """
-    latitude: Annotated[float, Field(ge=-90.0, le=90.0)]
-    longitude: Annotated[float, Field(ge=-180.0, le=180.0)]
+    global _runtime_users
+    async with _runtime_lock:
+        _runtime_users += 1
+        if _runtime_users == 1:
+            get_http_client()
+            await PREFETCHER.start()
+    try:
+        yield
+    finally:
+        async with _runtime_lock:
+            _runtime_users -= 1
+            if _runtime_users == 0:
+                await _release_runtime()
 
-# ----------------------------------------------------------------------------------------------------------------------
-# HELPER FUNCTIONS
-# ----------------------------------------------------------------------------------------------------------------------
 
-async def fetch_json(
-    url: str,
-    params: Dict[str, Any],
-    count_key: str
-) -> Dict[str, Any]:
+@asynccontextmanager
+async def server_lifespan(server: FastMCP) -> AsyncIterator[Dict[str, Any]]:
     """
-    Core HTTP GET utility with retry/backoff and API call tracking.
+    MCP lifespan (once for stdio, per session or request for the HTTP transports).
     """
-    global client 
-    API_CALLS[count_key] += 1
-    logger.info(f"Initiating {count_key} API call #{API_CALLS[count_key]} to {url} with params: {params}")
-    backoff = 1
-    for attempt in range(3):
-        try:
-            resp = await client.get(url, params=params)
-            resp.raise_for_status()
-            logger.info(f"API call to {url} successful.")
-            return resp.json()
-        except httpx.TimeoutException as timeout_err:
-            logger.warning(f"{count_key} timeout error attempt {attempt+1}: {timeout_err}")
-            if attempt == 2: raise
-            await asyncio.sleep(backoff)
-            backoff *= 2
-        except httpx.HTTPStatusError as st_err:
-            logger.error(f"{count_key} HTTP status {st_err.response.status_code} for {url}. Response: {st_err.response.text}")
-            raise
-        except httpx.RequestError as req_err:
-            logger.warning(f"{count_key} network error attempt {attempt+1}: {req_err}")
-            if attempt == 2: raise
-            await asyncio.sleep(backoff)
-            backoff *= 2
-
-    # Fallback attempt 
-    resp = await client.get(url, params=params)
-    resp.raise_for_status()
-    logger.info(f"API call to {url} successful on final attempt.")
-    return resp.json()
+    async with server_runtime():
+        yield {}
 
 
-async def get_coordinates(location_name: str) -> Tuple[float, float]:
+# Initialize MCP server under the "weather" namespace
+class WeatherMCP(FastMCP):
     """
-    Geocode a free-text location using Nominatim (OpenStreetMap) via geopy.
+    FastMCP that times the encoding of each tool result into MCP text content as the "encode" stage; for
+    json output this is where the payload is actually serialized.
     """
-    API_CALLS["geocoding"] += 1
-    logger.info(f"Geocoding call #{API_CALLS['geocoding']} for '{location_name}'")
-    try:
-        async with Nominatim(
-            user_agent="openmeteo_mcp_tool",
-            adapter_factory=AioHTTPAdapter,
-            timeout=15
-        ) as geolocator:
-            geocode = AsyncRateLimiter(geolocator.geocode, min_delay_seconds=1.1)
-            logger.debug(f"Attempting geocode for: {location_name}")
-            location = await geocode(location_name, exactly_one=True)
-            logger.debug(f"Geocode result for '{location_name}': {location}")
-            if location is None:
-                logger.warning(f"Geocoding failed: Location '{location_name}' not found.")
-                raise ValueError(f"Location '{location_name}' not found.")
-            logger.info(f"Geocoding successful for '{location_name}': ({location.latitude}, {location.longitude})")
-            return location.latitude, location.longitude
-    except Exception as e:
-        logger.error(f"Geocoding error for '{location_name}': {e}", exc_info=True)
-        raise ValueError(f"Failed to geocode '{location_name}': {e}")
 
-# ----------------------------------------------------------------------------------------------------------------------
-# VARIABLE LISTS (from Open-Meteo docs) - Double-check these are correct for your needs
-# ----------------------------------------------------------------------------------------------------------------------
+    async def call_tool(self, name: str, arguments: Dict[str, Any]) -> Sequence[Any]:
+        # Same steps as FastMCP.call_tool in mcp 1.9.4, split so the conversion can be timed on its own
+        result = await self._tool_manager.call_tool(name, arguments, context=self.get_context())
+        token = _CURRENT_TOOL.set(name)
+        try:
+            with METRICS.timed("encode"):
+                return _convert_to_content(result)
+        finally:
+            _CURRENT_TOOL.reset(token)
 
-DEFAULT_HOURLY_VARS: List[str] = [
-    "temperature_2m", "relative_humidity_2m", "dew_point_2m", "apparent_temperature",
-    "precipitation", "rain", "snowfall", "snow_depth", "weather_code",
-    "pressure_msl", "cloud_cover", "shortwave_radiation", "direct_radiation",
-    "diffuse_radiation", "uv_index"
-]
-DEFAULT_DAILY_VARS: List[str] = [
-    "weather_code", "temperature_2m_max", "temperature_2m_min", "apparent_temperature_max", "apparent_temperature_min",
-    "sunrise", "sunset", "daylight_duration", "sunshine_duration",
-    "precipitation_sum", "rain_sum", "snowfall_sum", "precipitation_hours",
-    "uv_index_max", "wind_speed_10m_max", "wind_gusts_10m_max"
-]
+
+mcp = WeatherMCP("weather", lifespan=server_lifespan)
 
 # ----------------------------------------------------------------------------------------------------------------------
 # MCP TOOLS
 # ----------------------------------------------------------------------------------------------------------------------
 
 @mcp.tool()
+@instrumented
 async def get_forecast(
     place: Optional[str] = None,
     latitude: Optional[float] = None,
@@ -148,7 +2887,10 @@ async def get_forecast(
     forecast_days: Optional[int] = DEFAULT_FORECAST_DAYS,
     past_days: Optional[int] = DEFAULT_PAST_DAYS,
     variables: Optional[str] = None, 
-    daily_variables: Optional[str] = None 
+    daily_variables: Optional[str] = None,
+    output_format: str = "json",
+    resample: Optional[str] = None,
+    aggregate: str = "mean"
 ) -> Dict[str, Any]:
     """
     **CORE PURPOSE:** Retrieve **future** weather forecasts and weather data for the **very recent past**. Uses the main Open-Meteo real-time forecast API.
@@ -174,88 +2916,57 @@ async def get_forecast(
         If None, default hourly list is used if granularity is 15 or 60.
     - `daily_variables` (Optional[str]): Comma-separated list of specific **daily aggregation** weather variable names (e.g., "temperature_2m_max,precipitation_sum,sunrise,sunset"). 
         If None, default daily list is used if granularity is >= 1440 OR if specific daily vars are needed alongside hourly/minutely data. **Use this to request daily summaries like sunrise/sunset even when getting hourly data.**
+    - `output_format` (Optional[str], Default: "json"): `json` returns the raw Open-Meteo JSON. `numpy`, `arrow` or `parquet` return typed
+        columns (times as int64 Unix epoch seconds) for ML pipelines; small `numpy` results are inlined, everything else is written to a file
+        whose path is returned under `files`.
+    - `resample` (Optional[str]): Aggregate the data server-side into buckets of this size instead of returning every time step:
+        `<n>h` (hours), `<n>d` (days), `<n>w` (weeks, starting on Monday) or `<n>M` (calendar months), e.g. "3h", "1d", "1w", "1M".
+        Buckets are labelled by their local start time. **Use this when only summaries are needed (e.g. daily means, weekly totals).**
+    - `aggregate` (Optional[str], Default: "mean"): Comma-separated reducers applied per bucket when `resample` is set:
+        `mean`, `min`, `max`, `sum`, `count` or percentiles such as `p10`, `p90`. Output columns are named `<variable>_<reducer>`
+        (e.g. "precipitation_sum"); non-numeric variables such as sunrise are listed under `resample.skipped`.
     **RETURNS:**
     - Weather data containing predictions for the future period requested (`forecast_days`) and/or observations/analysis for the recent past period requested (`past_days`).
+    - `requested` / `snapped`: The coordinate asked for and the grid point the data was fetched for (see `GRID_RESOLUTION`).
     """
 
 
 
-    logger.info(f"Received get_forecast: place='{place}', lat={latitude}, lon={longitude}, "
-                f"granularity={granularity}, forecast_days={forecast_days}, past_days={past_days}, "
-                f"vars='{variables}', daily_vars='{daily_variables}'") 
+    log_sampled(logging.INFO, "Received get_forecast: place='%s', lat=%s, lon=%s, granularity=%s, forecast_days=%s, "
+                "past_days=%s, vars='%s', daily_vars='%s', resample=%s",
+                place, latitude, longitude, granularity, forecast_days, past_days, variables, daily_variables, resample)
     
 
-    if place:
-        try:
-            latitude, longitude = await get_coordinates(place)
-        except ValueError as e:
-            return {"status": "error", "message": str(e)}
-        if latitude is None or longitude is None:
-             return {"status": "error", "message": f"Could not geocode '{place}'."}
-
-    if latitude is None or longitude is None:
-        return {"status": "error", "message": "Either 'place' or both 'latitude' and 'longitude' must be provided."}
-
     try:
-        coord = Coordinate(latitude=latitude, longitude=longitude) 
-    except ValidationError as e:
-        logger.warning(f"Coordinate validation failed: {e.errors()}")
-        return {"status": "error", "message": f"Invalid coordinates: {e.errors()}"}
-
-    # --- Prepare API Parameters ---
-    params = {
-        "latitude": coord.latitude,
-        "longitude": coord.longitude,
-        "timezone": TIMEZONE, 
-    }
-
-    # Handle primary variables based on granularity
-    if granularity == 15:
-        key = "minutely_15"; default_vars = DEFAULT_HOURLY_VARS 
-        params[key] = variables or ",".join(default_vars)
-    elif granularity == 60:
-        key = "hourly"; default_vars = DEFAULT_HOURLY_VARS
-        params[key] = variables or ",".join(default_vars)
-    elif granularity >= 1440:
-        # If granularity is daily, primary request is daily
-        key = "daily"; default_vars = DEFAULT_DAILY_VARS
-        # Prioritize explicit daily_variables if provided for daily granularity
-        params[key] = daily_variables or variables or ",".join(default_vars)
-    else:
-        return {"status": "error", "message": f"Unsupported granularity: {granularity}. Use 15, 60, or >=1440."}
-
-    # Add explicitly requested daily variables, regardless of main granularity
-    if daily_variables:
-         params["daily"] = daily_variables
-    # If granularity is daily, ensure the 'daily' key is set (might have been done above)
-    elif granularity >= 1440 and "daily" not in params:
-         # This handles the case where granularity is daily, but neither 'daily_variables' nor 'variables' were provided
-         params["daily"] = ",".join(DEFAULT_DAILY_VARS)
-
-    # Handle forecast_days and past_days
-    # Set default forecast days only if neither forecast nor past days are specified.
-    add_default_forecast = True
-    if forecast_days is not None and forecast_days > 0:
-         params["forecast_days"] = min(forecast_days, 16) # API limit is 16
-         add_default_forecast = False # User specified forecast days
-
-    if past_days is not None and past_days > 0:
-        # Let the API handle the upper limit for past_days as it varies.
-        params["past_days"] = past_days
-        add_default_forecast = False # User specified past days
-
-    # Add default forecast days if no forecast/past days were specified
-    if add_default_forecast:
-        params["forecast_days"] = DEFAULT_FORECAST_DAYS
+        check_output_format(output_format)
+        interval = parse_resample(resample, aggregate) if resample else None
+        requested = await resolve_coordinate(place, latitude, longitude)
+        coord = snap_coordinate(requested, "forecast")
+        # --- Prepare API Parameters ---
+        params = {"latitude": coord.latitude, "longitude": coord.longitude}
+        with METRICS.timed("build_params"):
+            params.update(build_forecast_params(granularity, forecast_days, past_days, variables, daily_variables))
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
 
     # --- API Call and Error Handling ---
     url = FORECAST_API_BASE 
 
     try:
         
-        data = await fetch_json(url, params, "forecast")
-        logger.info("get_forecast successful.")
-        return {"status": "success", "data": data}
+        data = await fetch_json(
+            url, params, "forecast",
+            cache_ttl=forecast_cache_ttl(),
+            stale_while_revalidate=STALE_WHILE_REVALIDATE
+        )
+        if interval is not None:
+            with METRICS.timed("resample"):
+                data = await asyncio.to_thread(resample_payload, data, *interval)
+        if output_format != "json":
+            with METRICS.timed("serialize"):
+                data = await asyncio.to_thread(render_output, data, output_format, "forecast")
+        log_sampled(logging.INFO, "get_forecast successful.")
+        return {"status": "success", **snap_report(requested, coord), "data": data}
     except Exception as err:
         logger.error(f"get_forecast failed for url {url} with params {params}: {err}", exc_info=True)
 
@@ -282,6 +2993,7 @@ async def get_forecast(
 
 
 @mcp.tool()
+@instrumented
 async def get_history(
     place: Optional[str] = None,
     latitude: Optional[float] = None,
@@ -290,6 +3002,9 @@ async def get_history(
     end_date: Optional[str] = None,   
     granularity: int = 60,
     variables: Optional[str] = None,
+    output_format: str = "json",
+    resample: Optional[str] = None,
+    aggregate: str = "mean",
 ) -> Dict[str, Any]:
     """
     **CORE PURPOSE:** Retrieve **historical** archived weather data for **specific past dates or date ranges**. Uses the dedicated Open-Meteo Archive API.
@@ -312,70 +3027,377 @@ async def get_history(
         - `>=1440`: Daily summary intervals.
         - **Note:** 15-minute data is typically **not available** via the historical archive API. Do not request `granularity=15`.
     - `variables` (Optional[str]): Comma-separated list of specific weather variable names (e.g., "temperature_2m,precipitation_sum,sunshine_duration") to override the defaults. Ensure variables are valid for the chosen granularity and available in the historical archive. If None, default hourly/daily lists are used based on granularity.
+    - `output_format` (Optional[str], Default: "json"): `json` returns the raw Open-Meteo JSON. `numpy`, `arrow` or `parquet` return typed
+        columns (times as int64 Unix epoch seconds) for ML pipelines; small `numpy` results are inlined, everything else is written to a file
+        whose path is returned under `files`.
+    - `resample`, `aggregate` (Optional[str]): Server-side aggregation, as in `get_forecast` (e.g. `resample="1w"` with
+        `aggregate="mean,max"`, or `resample="1M"` with `aggregate="sum"` for monthly precipitation totals). **Prefer this over
+        fetching full hourly series for long ranges when only summaries are needed.**
 
     **RETURNS:**
     - Archived historical weather data for the specified location and date range.
+    - `requested` / `snapped`: The coordinate asked for and the grid point the data was fetched for (see `GRID_RESOLUTION`).
     """
-    logger.info(f"Received get_history: place='{place}', lat={latitude}, lon={longitude}, "
-                f"start={start_date}, end={end_date}, granularity={granularity}")
+    log_sampled(logging.INFO, "Received get_history: place='%s', lat=%s, lon=%s, start=%s, end=%s, granularity=%s, resample=%s",
+                place, latitude, longitude, start_date, end_date, granularity, resample)
     
 
-    if place:
-        try:
-            latitude, longitude = await get_coordinates(place)
-        except ValueError as e: return {"status": "error", "message": str(e)}
-        if latitude is None or longitude is None: return {"status": "error", "message": f"Could not geocode '{place}'."}
-
-    if latitude is None or longitude is None:
-        return {"status": "error", "message": "Either 'place' or both 'latitude' and 'longitude' must be provided."}
+    try:
+        check_output_format(output_format)
+        interval = parse_resample(resample, aggregate) if resample else None
+        requested = await resolve_coordinate(place, latitude, longitude)
+        coord = snap_coordinate(requested, "history")
+        with METRICS.timed("build_params"):
+            sd, ed, key, param_vars = build_history_request(start_date, end_date, granularity, variables)
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
 
     try:
-        coord = Coordinate(latitude=latitude, longitude=longitude)
-    except ValidationError as e: return {"status": "error", "message": f"Invalid coordinates: {e.errors()}"}
+        if interval is not None:
+            data = await fetch_history_resampled(coord, sd, ed, key, param_vars, *interval)
+        else:
+            data = await fetch_history_chunked(coord, sd, ed, key, param_vars)
+        if output_format != "json":
+            with METRICS.timed("serialize"):
+                data = await asyncio.to_thread(render_output, data, output_format, "history")
+        log_sampled(logging.INFO, "get_history successful.")
+        return {"status": "success", **snap_report(requested, coord), "data": data}
+    except Exception as err:
+        logger.error(f"get_history failed: {err}", exc_info=True)
+        # Provide more specific error if possible
+        if isinstance(err, httpx.HTTPStatusError) and err.response.status_code == 400:
+             return {"status": "error", "message": f"Failed to retrieve history due to invalid request (Error 400). Check if dates are valid and requested variables exist for the chosen granularity in the archive. Detail: {str(err)}"}
+        return {"status": "error", "message": f"Failed to retrieve history: {str(err)}"}
 
-    # ** Check for required dates **
-    if not start_date or not end_date:
-         return {"status": "error", "message": "The 'start_date' and 'end_date' parameters (in YYYY-MM-DD format) are required for retrieving historical weather data. Please provide the specific past date or date range."}
 
-    try:
-        sd = date.fromisoformat(start_date)
-        ed = date.fromisoformat(end_date)
-        if sd > ed: raise ValueError("start_date must be less than or equal to end_date")
-    except ValueError as date_err:
-        return {"status": "error", "message": f"Invalid date format or range: {date_err}. Use YYYY-MM-DD format for start_date and end_date."}
 
-    if granularity == 60:
-        key = "hourly"; param_vars = variables or ",".join(DEFAULT_HOURLY_VARS)
-    elif granularity >= 1440:
-        key = "daily"; param_vars = variables or ",".join(DEFAULT_DAILY_VARS)
-    else: # Explicitly forbid 15 for history
-        return {"status": "error", "message": f"Unsupported granularity for history: {granularity}. Use 60 (hourly) or >=1440 (daily). 15-minute data is not available."}
+@mcp.tool()
+@instrumented
+async def get_history_page(
+    place: Optional[str] = None,
+    latitude: Optional[float] = None,
+    longitude: Optional[float] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    granularity: int = 60,
+    variables: Optional[str] = None,
+    cursor: Optional[str] = None,
+    page_months: int = 1,
+    output_format: str = "json",
+) -> Dict[str, Any]:
+    """
+    **CORE PURPOSE:** Same as `get_history`, but returns a **long date range page by page** (calendar months) so that multi-year
+    hourly pulls never have to fit into one response.
 
-    params = {
-        "latitude": coord.latitude, "longitude": coord.longitude,
-        "start_date": sd.isoformat(), "end_date": ed.isoformat(),
-        "timezone": TIMEZONE, key: param_vars
-    }
+    **WHEN TO USE THIS TOOL:**
+    - Use for **long historical ranges** (many months or years), e.g. building ML training sets.
+    - For short ranges, `get_history` is simpler.
+
+    **PARAMETERS:**
+    - `place` OR `latitude`/`longitude`, `start_date`, `end_date` (**Required**), `granularity`, `variables`, `output_format`: As in `get_history`.
+    - `cursor` (Optional[str]): Omit for the first page; afterwards pass the `next_cursor` value from the previous page.
+    - `page_months` (Optional[int], Default: 1): Calendar months per page (1-12).
+
+    **NOTE:** Only settled archive months (older than about a week) are stored locally. Pages touching the most recent
+    week are not cached and are downloaded again on every call.
+
+    **RETURNS:**
+    - `data`: The archived data for this page only. `page.next_cursor` is the cursor for the next page, or null after the last page.
+    - `requested` / `snapped`: As in `get_history`.
+    """
+    log_sampled(logging.INFO, "Received get_history_page: place='%s', lat=%s, lon=%s, start=%s, end=%s, granularity=%s, cursor=%s",
+                place, latitude, longitude, start_date, end_date, granularity, cursor)
+
+    try:
+        check_output_format(output_format)
+        requested = await resolve_coordinate(place, latitude, longitude)
+        coord = snap_coordinate(requested, "history")
+        with METRICS.timed("build_params"):
+            sd, ed, key, param_vars = build_history_request(start_date, end_date, granularity, variables)
+        page_start = date.fromisoformat(cursor) if cursor else sd
+        if not sd <= page_start <= ed:
+            raise ValueError(f"Invalid cursor '{cursor}': it must lie between start_date and end_date.")
+        if not 1 <= page_months <= 12:
+            raise ValueError("page_months must be between 1 and 12.")
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
+
+    next_month = page_start.replace(day=1)
+    for _ in range(page_months):
+        next_month = (next_month.replace(day=28) + timedelta(days=4)).replace(day=1)
+    page_end = min(ed, next_month - timedelta(days=1))
+    next_cursor = (page_end + timedelta(days=1)).isoformat() if page_end < ed else None
 
     try:
-        data = await fetch_json(HISTORY_API_BASE, params, "history")
-        logger.info("get_history successful.")
-        return {"status": "success", "data": data}
+        data = await fetch_history_page(coord, page_start, page_end, key, param_vars)
+        with METRICS.timed("serialize"):
+            if output_format == "json":
+                data = plain_payload(data)
+            else:
+                data = await asyncio.to_thread(render_output, data, output_format, "history")
+        log_sampled(logging.INFO, "get_history_page successful.")
+        return {
+            "status": "success",
+            **snap_report(requested, coord),
+            "data": data,
+            "page": {"start_date": page_start.isoformat(), "end_date": page_end.isoformat(), "next_cursor": next_cursor}
+        }
     except Exception as err:
-        logger.error(f"get_history failed: {err}", exc_info=True)
-        # Provide more specific error if possible
+        logger.error(f"get_history_page failed: {err}", exc_info=True)
         if isinstance(err, httpx.HTTPStatusError) and err.response.status_code == 400:
              return {"status": "error", "message": f"Failed to retrieve history due to invalid request (Error 400). Check if dates are valid and requested variables exist for the chosen granularity in the archive. Detail: {str(err)}"}
         return {"status": "error", "message": f"Failed to retrieve history: {str(err)}"}
 
+
+@mcp.tool()
+@instrumented
+async def get_forecast_batch(
+    places: Optional[List[str]] = None,
+    latitudes: Optional[List[float]] = None,
+    longitudes: Optional[List[float]] = None,
+    granularity: int = 60,
+    forecast_days: Optional[int] = DEFAULT_FORECAST_DAYS,
+    past_days: Optional[int] = DEFAULT_PAST_DAYS,
+    variables: Optional[str] = None,
+    daily_variables: Optional[str] = None,
+    output_format: str = "json"
+) -> Dict[str, Any]:
+    """
+    **CORE PURPOSE:** Same as `get_forecast`, but for **many locations in one call** (e.g. a grid or a network of sites).
+
+    **WHEN TO USE THIS TOOL:**
+    - Use instead of calling `get_forecast` repeatedly when forecasts for **more than one location** are needed.
+
+    **PARAMETERS:**
+    - `places` (Optional[List[str]]): Place names to geocode (e.g., ["Prague, CZ", "Brno, CZ"]).
+    - `latitudes` / `longitudes` (Optional[List[float]]): Coordinate lists of equal length; element i of each forms one location.
+    - At least one location is required; places and coordinates may be combined (places are listed first in the results).
+    - `granularity`, `forecast_days`, `past_days`, `variables`, `daily_variables`, `output_format`: As in `get_forecast`, applied to every location.
+
+    **RETURNS:**
+    - `results`: One entry per location, in input order, each with its own `status` and either `data` or `message`,
+      plus `requested` / `snapped` coordinates for every location that could be resolved.
+      A location that cannot be geocoded or fetched does not fail the others. The top-level `status` is
+      `success`, `partial` or `error`.
+    """
+    log_sampled(logging.INFO, "Received get_forecast_batch: %d place(s), %d coordinate(s), granularity=%s, forecast_days=%s, past_days=%s",
+                len(places or []), len(latitudes or []), granularity, forecast_days, past_days)
+
+    try:
+        check_output_format(output_format)
+        with METRICS.timed("build_params"):
+            params = build_forecast_params(granularity, forecast_days, past_days, variables, daily_variables)
+        locations = await resolve_locations(places, latitudes, longitudes)
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
+
+    snapped = [snap_coordinate(resolved, "forecast") if isinstance(resolved, Coordinate) else None for _, resolved in locations]
+    coords = [coord for coord in snapped if coord is not None]
+    fetched = iter(await fetch_packed(FORECAST_API_BASE, params, coords, "forecast", forecast_cache_ttl()))
+    outcomes = [next(fetched) if isinstance(resolved, Coordinate) else resolved for _, resolved in locations]
+    if output_format != "json":
+        with METRICS.timed("serialize"):
+            outcomes = await asyncio.to_thread(render_outcomes, outcomes, output_format, "forecast")
+    log_sampled(logging.INFO, "get_forecast_batch finished.")
+    labels = [
+        {**label, **snap_report(resolved, coord)} if coord is not None else label
+        for (label, resolved), coord in zip(locations, snapped)
+    ]
+    return batch_response(labels, outcomes, "forecast")
+
+
+@mcp.tool()
+@instrumented
+async def get_history_batch(
+    places: Optional[List[str]] = None,
+    latitudes: Optional[List[float]] = None,
+    longitudes: Optional[List[float]] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    granularity: int = 60,
+    variables: Optional[str] = None,
+    output_format: str = "json",
+) -> Dict[str, Any]:
+    """
+    **CORE PURPOSE:** Same as `get_history`, but for **many locations in one call** (e.g. backfilling a network of sites).
+
+    **WHEN TO USE THIS TOOL:**
+    - Use instead of calling `get_history` repeatedly when archived data for **more than one location** is needed.
+
+    **PARAMETERS:**
+    - `places` (Optional[List[str]]): Place names to geocode (e.g., ["Prague, CZ", "Brno, CZ"]).
+    - `latitudes` / `longitudes` (Optional[List[float]]): Coordinate lists of equal length; element i of each forms one location.
+    - At least one location is required; places and coordinates may be combined (places are listed first in the results).
+    - `start_date`, `end_date` (**Required**), `granularity`, `variables`, `output_format`: As in `get_history`, applied to every location.
+
+    **RETURNS:**
+    - `results`: One entry per location, in input order, each with its own `status` and either `data` or `message`,
+      plus `requested` / `snapped` coordinates for every location that could be resolved.
+      A location that cannot be geocoded or fetched does not fail the others. The top-level `status` is
+      `success`, `partial` or `error`.
+    """
+    log_sampled(logging.INFO, "Received get_history_batch: %d place(s), %d coordinate(s), start=%s, end=%s, granularity=%s",
+                len(places or []), len(latitudes or []), start_date, end_date, granularity)
+
+    try:
+        check_output_format(output_format)
+        with METRICS.timed("build_params"):
+            sd, ed, key, param_vars = build_history_request(start_date, end_date, granularity, variables)
+        locations = await resolve_locations(places, latitudes, longitudes)
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
+
+    snapped = [snap_coordinate(resolved, "history") if isinstance(resolved, Coordinate) else None for _, resolved in locations]
+    coords = [coord for coord in snapped if coord is not None]
+    fetched = iter(await fetch_history_many(coords, sd, ed, key, param_vars) if coords else [])
+    outcomes = [next(fetched) if isinstance(resolved, Coordinate) else resolved for _, resolved in locations]
+    if output_format != "json":
+        with METRICS.timed("serialize"):
+            outcomes = await asyncio.to_thread(render_outcomes, outcomes, output_format, "history")
+    log_sampled(logging.INFO, "get_history_batch finished.")
+    labels = [
+        {**label, **snap_report(resolved, coord)} if coord is not None else label
+        for (label, resolved), coord in zip(locations, snapped)
+    ]
+    return batch_response(labels, outcomes, "history")
+
+@mcp.tool()
+async def get_server_stats(output_format: str = "json") -> Any:
+    """
+    **CORE PURPOSE:** Report the weather server's own health and performance (not weather data).
+
+    **WHEN TO USE THIS TOOL:**
+    - Use only when asked about the server itself: request counts, cache hit rates, latency, rate-limiter queues or connection pool usage.
+
+    **PARAMETERS:**
+    - `output_format` (Optional[str], Default: "json"): `json` for a structured report, `openmetrics` for Prometheus/OpenMetrics text.
+
+    **RETURNS:**
+    - Upstream call counts, cache statistics, event counters (retries, timeouts, errors), latency histograms per tool and per
+      upstream (geocode, build_params, upstream_queue, upstream, json_decode, resample, serialize, total), scheduler queues, HTTP pool
+      utilization, prefetcher status and the spatial index (share of requests snapped into an already known grid cell).
+    - With `--workers` > 1 every figure is for the worker process that answered (`process.pid`), not the whole server;
+      repeated calls may reach different workers. Scrape each worker, or sum the OpenMetrics output, for totals.
+    """
+    if output_format == "openmetrics":
+        gauges: Dict[str, Dict[str, float]] = {
+            "api_calls": dict(API_CALLS),
+            "cache_events": dict(CACHE_STATS),
+            "http_pool": {name: value for name, value in http_pool_stats().items() if isinstance(value, (int, float))},
+        }
+        for host, host_stats in SCHEDULER.stats().items():
+            for name, value in host_stats.items():
+                gauges.setdefault(f"scheduler_{name}", {})[host] = value
+        for dataset, index in GRID_INDEXES.items():
+            for name, value in index.stats().items():
+                if value is not None:
+                    gauges.setdefault(f"spatial_index_{name}", {})[dataset] = value
+        return {"status": "success", "text": METRICS.openmetrics(gauges)}
+    if output_format != "json":
+        return {"status": "error", "message": f"Unsupported output_format: '{output_format}'. Use json or openmetrics."}
+
+    return {
+        "status": "success",
+        "api_calls": dict(API_CALLS),
+        "cache": {**CACHE_STATS, "response_cache_entries": len(RESPONSE_CACHE), "aggregate_cache_entries": len(AGGREGATE_CACHE)},
+        "counters": dict(METRICS.counters),
+        "latency_seconds": METRICS.snapshot(),
+        "scheduler": SCHEDULER.stats(),
+        "http_pool": http_pool_stats(),
+        "prefetch": dict(PREFETCHER.stats),
+        "spatial_index": {dataset: index.stats() for dataset, index in GRID_INDEXES.items()},
+        "process": {"pid": os.getpid(), "active_calls": ACTIVE_CALLS.active, "shared_state": RESPONSE_CACHE.path},
+    }
+
+# ----------------------------------------------------------------------------------------------------------------------
+# NETWORK TRANSPORT
+# ----------------------------------------------------------------------------------------------------------------------
+
+def enable_shared_state() -> None:
+    """
+    Share the response cache (SHARED_CACHE_PATH), the per-host rate limits and the prefetch leadership
+    (SHARED_COORDINATION_PATH) with the other worker processes.
+    """
+    global RESPONSE_CACHE, SCHEDULER
+    RESPONSE_CACHE = ResponseCache(path=SHARED_CACHE_PATH)
+    SCHEDULER = RequestScheduler(shared_path=SHARED_COORDINATION_PATH)
+    # One worker prefetches the watch list for all of them
+    PREFETCHER.lease = LeaderLease(SHARED_COORDINATION_PATH, "prefetch")
+    PREFETCHER.stats["leader"] = False
+
+
+def build_http_app(transport: str) -> Starlette:
+    """
+    ASGI app for the "streamable-http" or "sse" transport. The app holds the server runtime for its whole
+    lifetime, so shared resources outlive individual MCP sessions and are drained once on shutdown.
+    """
+    if transport == "streamable-http":
+        # Stateless: every request is self-contained, so any worker process can serve it. Plain JSON responses
+        # instead of per-request SSE streams, which sse-starlette would cut off on shutdown instead of draining them
+        mcp.settings.stateless_http = True
+        mcp.settings.json_response = True
+        app = mcp.streamable_http_app()
+    else:
+        app = mcp.sse_app()
+    transport_lifespan = app.router.lifespan_context
+
+    @asynccontextmanager
+    async def lifespan(app: Starlette) -> AsyncIterator[None]:
+        async with server_runtime(), transport_lifespan(app):
+            yield
+
+    app.router.lifespan_context = lifespan
+    return app
+
+
+def create_app() -> Starlette:
+    """
+    uvicorn factory for the streamable HTTP workers (`server:create_app`); runs once in every worker process.
+    """
+    if os.environ.get(SHARED_STATE_ENV) == "1":
+        enable_shared_state()
+    return build_http_app("streamable-http")
+
+
+def run_http(transport: str, host: str, port: int, workers: int) -> None:
+    """
+    Serve over HTTP with uvicorn. Several workers share one port and, through the shared SQLite files, one response
+    cache and one rate-limit budget. On SIGINT/SIGTERM uvicorn stops accepting connections and waits up to
+    DRAIN_TIMEOUT for open requests before the runtime is released.
+    """
+    if workers > 1 and transport != "streamable-http":
+        raise ValueError("Multiple workers require --transport streamable-http (SSE sessions are tied to one process).")
+    options: Dict[str, Any] = {"host": host, "port": port, "timeout_graceful_shutdown": int(DRAIN_TIMEOUT)}
+    if workers > 1:
+        # Workers are separate processes that import this module; they pick the shared state up from the environment
+        os.environ[SHARED_STATE_ENV] = "1"
+        uvicorn.run(
+            "server:create_app", factory=True, workers=workers,
+            app_dir=os.path.dirname(os.path.abspath(__file__)), **options
+        )
+    else:
+        uvicorn.run(build_http_app(transport), **options)
+
 # ----------------------------------------------------------------------------------------------------------------------
 # MAIN ENTRYPOINT - Simplified
 # ----------------------------------------------------------------------------------------------------------------------
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Weather MCP server.")
+    parser.add_argument("--transport", choices=("stdio", "streamable-http", "sse"), default="stdio",
+                        help="stdio for a single local client (default); an HTTP transport to serve many clients.")
+    parser.add_argument("--host", default=HTTP_HOST, help="HTTP transports: interface to bind.")
+    parser.add_argument("--port", type=int, default=HTTP_PORT, help="HTTP transports: port to listen on.")
+    parser.add_argument("--workers", type=int, default=HTTP_WORKERS,
+                        help="streamable-http: worker processes sharing the port, caches and rate limits.")
+    args = parser.parse_args()
+
     try:
         logger.info("Starting MCP server...")
-        mcp.run(transport="stdio")
+        if args.transport == "stdio":
+            mcp.run(transport="stdio")
+        else:
+            run_http(args.transport, args.host, args.port, args.workers)
         logger.info("MCP server finished running.")
 
     except KeyboardInterrupt:
@@ -383,12 +3405,3 @@ if __name__ == "__main__":
     except Exception as e:
         # Log any exceptions that occur during server setup or runtime if they bubble up
         logger.exception(f"Server encountered a fatal error: {e}")
-    finally:
-        logger.info("Initiating HTTP client cleanup...")
-        try:
-            
-            asyncio.run(client.aclose())
-            logger.info("HTTP client closed successfully.")
-        except Exception as close_err:
-            # Log errors during cleanup, but don't crash the exit process
-            logger.error(f"Error during HTTP client cleanup: {close_err}", exc_info=True)
@@ -0,0 +1,84 @@
+import math
+from array import array
+from datetime import date, timedelta
+
+import server
+
+
+def _part(times, values):
+    return {"latitude": 50.0, "hourly": {"time": times, "temperature_2m": values}}
+
+
+def test_stitch_array_then_list():
+    parts = [
+        _part(["2023-01-31T22:00", "2023-01-31T23:00"], array("d", [1.0, math.nan])),
+        _part(["2023-02-01T00:00", "2023-02-01T01:00"], [3.0, None]),
+    ]
+    stitched = server.stitch_chunks(parts, "hourly", date(2023, 1, 31), date(2023, 2, 1))
+    assert stitched["hourly"]["temperature_2m"] == [1.0, None, 3.0, None]
+    assert len(stitched["hourly"]["time"]) == 4
+
+
+def test_stitch_list_then_array():
+    parts = [
+        _part(["2023-01-31T22:00", "2023-01-31T23:00"], [1.0, None]),
+        _part(["2023-02-01T00:00", "2023-02-01T01:00"], array("d", [math.nan, 4.0])),
+    ]
+    stitched = server.stitch_chunks(parts, "hourly", date(2023, 1, 31), date(2023, 2, 1))
+    assert stitched["hourly"]["temperature_2m"] == [1.0, None, None, 4.0]
+    assert server.plain_payload(stitched)["hourly"]["temperature_2m"] == [1.0, None, None, 4.0]
+
+
+def test_stitch_arrays_stay_compact():
+    parts = [
+        _part(["2023-01-31T23:00"], array("d", [1.0])),
+        _part(["2023-02-01T00:00"], array("d", [math.nan])),
+    ]
+    column = server.stitch_chunks(parts, "hourly", date(2023, 1, 31), date(2023, 2, 1))["hourly"]["temperature_2m"]
+    assert isinstance(column, array)
+    assert server.plain_payload({"hourly": {"v": column}})["hourly"]["v"] == [1.0, None]
+
+
+def test_month_chunks_fetch_past_months_whole():
+    assert server.month_chunks(date(2023, 12, 15), date(2024, 3, 10)) == [
+        (date(2023, 12, 1), date(2023, 12, 31)),
+        (date(2024, 1, 1), date(2024, 1, 31)),
+        (date(2024, 2, 1), date(2024, 2, 29)),
+        (date(2024, 3, 1), date(2024, 3, 31)),
+    ]
+
+
+def test_month_chunks_single_day_on_a_month_boundary():
+    assert server.month_chunks(date(2023, 2, 28), date(2023, 3, 1)) == [
+        (date(2023, 2, 1), date(2023, 2, 28)),
+        (date(2023, 3, 1), date(2023, 3, 31)),
+    ]
+
+
+def test_month_chunks_cut_the_current_month_at_end():
+    today = date.today()
+    month_start = today.replace(day=1)
+    chunks = server.month_chunks(month_start - timedelta(days=1), today)
+    previous_start = (month_start - timedelta(days=1)).replace(day=1)
+    assert chunks == [(previous_start, month_start - timedelta(days=1)), (month_start, today)]
+
+
+def test_stitch_trims_hourly_chunks_to_the_requested_days():
+    january = _part([f"2023-01-{day:02d}T{hour:02d}:00" for day in range(1, 32) for hour in range(24)],
+                    [float(day) for day in range(1, 32) for _ in range(24)])
+    february = _part([f"2023-02-{day:02d}T{hour:02d}:00" for day in range(1, 29) for hour in range(24)],
+                     [float(100 + day) for day in range(1, 29) for _ in range(24)])
+    block = server.stitch_chunks([january, february], "hourly", date(2023, 1, 30), date(2023, 2, 2))["hourly"]
+    assert block["time"][0] == "2023-01-30T00:00"
+    assert block["time"][-1] == "2023-02-02T23:00"
+    assert len(block["time"]) == len(block["temperature_2m"]) == 4 * 24
+    assert block["temperature_2m"][-1] == 102.0
+
+
+def test_stitch_trims_daily_chunks():
+    parts = [
+        {"daily": {"time": ["2023-01-30", "2023-01-31"], "precipitation_sum": [1.0, 2.0]}},
+        {"daily": {"time": ["2023-02-01", "2023-02-02"], "precipitation_sum": [3.0, 4.0]}},
+    ]
+    block = server.stitch_chunks(parts, "daily", date(2023, 1, 31), date(2023, 2, 1))["daily"]
+    assert block == {"time": ["2023-01-31", "2023-02-01"], "precipitation_sum": [2.0, 3.0]}
@@ -0,0 +1,63 @@
+import asyncio
+from types import SimpleNamespace
+
+import server
+
+
+class _Geocoder:
+    def __init__(self):
+        self.calls = []
+
+    async def geocode(self, name, exactly_one=True):
+        self.calls.append(name)
+        await asyncio.sleep(0.01)
+        return SimpleNamespace(latitude=50.08, longitude=14.42)
+
+
+def _setup(monkeypatch):
+    geocoder = _Geocoder()
+    monkeypatch.setattr(server, "_get_geocoder", lambda: geocoder)
+    monkeypatch.setattr(server, "GEOCODE_CACHE", server.GeocodeCache(path=None))
+    monkeypatch.setattr(server, "SCHEDULER", server.RequestScheduler())
+    return geocoder
+
+
+def test_repeated_places_in_a_batch_are_geocoded_once(monkeypatch):
+    geocoder = _setup(monkeypatch)
+    locations = asyncio.run(server.resolve_locations(["Prague, CZ"] * 20 + ["prague,  cz"], [50.0], [14.0]))
+    assert len(geocoder.calls) == 1
+    assert [label for label, _ in locations][:2] == [{"place": "Prague, CZ"}, {"place": "Prague, CZ"}]
+    assert all(coord.latitude == 50.08 for _, coord in locations[:21])
+    assert locations[-1][1].latitude == 50.0
+
+
+def test_concurrent_lookups_share_one_geocode(monkeypatch):
+    geocoder = _setup(monkeypatch)
+
+    async def lookups():
+        return await asyncio.gather(*(server.get_coordinates("Brno, CZ") for _ in range(10)))
+
+    assert asyncio.run(lookups()) == [(50.08, 14.42)] * 10
+    assert len(geocoder.calls) == 1
+
+
+def test_disk_tier_survives_a_restart(tmp_path):
+    path = str(tmp_path / "geocode.sqlite3")
+    cache = server.GeocodeCache(path=path)
+    asyncio.run(cache.aput("Prague,  CZ", 50.08, 14.42))
+    cache.close()
+
+    restarted = server.GeocodeCache(path=path)
+    assert restarted.get("prague, cz") is None
+    assert asyncio.run(restarted.aget("PRAGUE, CZ")) == (50.08, 14.42)
+    # Now remembered in memory
+    assert restarted.get("prague, cz") == (50.08, 14.42)
+    restarted.close()
+
+
+def test_expired_entries_are_not_served(tmp_path):
+    cache = server.GeocodeCache(path=str(tmp_path / "geocode.sqlite3"), ttl=0.0)
+    asyncio.run(cache.aput("Brno", 49.2, 16.6))
+    assert cache.get("Brno") is None
+    assert asyncio.run(cache.aget("Brno")) is None
+    cache.close()
@@ -0,0 +1,29 @@
+import server
+
+
+def _snap(index, latitude, longitude, tool="get_forecast"):
+    token = server._CURRENT_TOOL.set(tool)
+    try:
+        return index.snap(server.Coordinate(latitude=latitude, longitude=longitude))
+    finally:
+        server._CURRENT_TOOL.reset(token)
+
+
+def test_only_merged_coordinates_count_as_hits():
+    index = server.GridIndex(0.01)
+    assert _snap(index, 50.0012, 14.0049) == server.Coordinate(latitude=50.0, longitude=14.0)
+    # The same coordinate again shares a cache entry without any snapping
+    _snap(index, 50.0012, 14.0049)
+    _snap(index, 49.9981, 14.0021)
+    _snap(index, 51.0, 14.0)
+    stats = index.stats()
+    assert (stats["lookups"], stats["hits"], stats["cells"]) == (4, 1, 2)
+
+
+def test_background_lookups_are_not_counted():
+    index = server.GridIndex(0.01)
+    _snap(index, 50.0012, 14.0049, tool="background")
+    _snap(index, 49.9981, 14.0021, tool="background")
+    assert (index.lookups, index.hits) == (0, 0)
+    _snap(index, 50.0031, 14.0)
+    assert (index.lookups, index.hits) == (1, 1)
@@ -0,0 +1,55 @@
+import asyncio
+from datetime import date, timedelta
+
+import pytest
+
+import server
+
+COORD = server.Coordinate(latitude=50.0, longitude=14.0)
+
+
+def _payload(start, end):
+    days = [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+    return {"latitude": 50.0, "longitude": 14.0, "daily": {
+        "time": [day.isoformat() for day in days], "temperature_2m_max": [float(day.day) for day in days]
+    }}
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    requested = []
+
+    async def fetch_upstream(url, params, count_key):
+        start, end = date.fromisoformat(params["start_date"]), date.fromisoformat(params["end_date"])
+        requested.append((start, end))
+        return _payload(start, end)
+
+    monkeypatch.setattr(server, "_fetch_upstream", fetch_upstream)
+    monkeypatch.setattr(server, "RESPONSE_CACHE", server.ResponseCache())
+    monkeypatch.setattr(server, "WEATHER_STORE", server.WeatherStore(path=None))
+    return requested
+
+
+def _history(start, end):
+    return asyncio.run(server.fetch_history_chunked(COORD, start, end, "daily", "temperature_2m_max"))
+
+
+def test_fetch_range_clips_small_edges_only():
+    january = (date(2023, 1, 1), date(2023, 1, 31))
+    assert server.fetch_range(*january, date(2023, 1, 15), date(2023, 1, 15)) == (date(2023, 1, 15), date(2023, 1, 15))
+    assert server.fetch_range(*january, date(2023, 1, 10), date(2023, 3, 1)) == january
+    assert server.fetch_range(*january, date(2022, 12, 1), date(2023, 1, 5)) == (date(2023, 1, 1), date(2023, 1, 5))
+
+
+def test_single_day_fetches_only_that_day(upstream):
+    data = _history(date(2023, 1, 15), date(2023, 1, 15))
+    assert upstream == [(date(2023, 1, 15), date(2023, 1, 15))]
+    assert data["daily"]["time"] == ["2023-01-15"]
+
+
+def test_cached_whole_month_answers_a_clipped_request(upstream):
+    _history(date(2023, 1, 1), date(2023, 1, 31))
+    upstream.clear()
+    data = _history(date(2023, 1, 20), date(2023, 1, 21))
+    assert upstream == []
+    assert data["daily"]["temperature_2m_max"] == [20.0, 21.0]
@@ -0,0 +1,55 @@
+import asyncio
+
+import httpx
+
+import server
+
+URL = "http://upstream.test/v1/forecast"
+
+
+def _fake_upstream(bad_latitudes, calls):
+    async def fetch(url, params, key, count_key, cache_ttl):
+        latitudes = [float(lat) for lat in str(params["latitude"]).split(",")]
+        calls.append(latitudes)
+        if bad_latitudes & set(latitudes):
+            request = httpx.Request("GET", url)
+            raise httpx.HTTPStatusError("rejected", request=request, response=httpx.Response(400, request=request))
+        payloads = [{"latitude": lat} for lat in latitudes]
+        return payloads[0] if len(payloads) == 1 else payloads
+    return fetch
+
+
+def _fetch(monkeypatch, sites, bad_latitudes):
+    calls = []
+    monkeypatch.setattr(server, "_retry_server_errors", _fake_upstream(bad_latitudes, calls))
+    single_params = [{"latitude": float(lat), "longitude": 0.0} for lat in range(sites)]
+    keys = [server.ResponseCache.make_key(URL, params) for params in single_params]
+    return asyncio.run(server._fetch_packet(URL, single_params, keys, "forecast", None)), calls
+
+
+def test_packet_bisects_around_one_bad_site(monkeypatch):
+    results, calls = _fetch(monkeypatch, 100, {37.0})
+    assert isinstance(results[37], httpx.HTTPStatusError)
+    assert [result["latitude"] for i, result in enumerate(results) if i != 37] == [float(i) for i in range(100) if i != 37]
+    # packet + two probes + two requests per bisection level, far below one request per site
+    assert len(calls) <= 3 + 2 * 7
+
+
+def test_packet_rejected_by_shared_parameters(monkeypatch):
+    results, calls = _fetch(monkeypatch, 10, {float(lat) for lat in range(10)})
+    assert all(isinstance(result, httpx.HTTPStatusError) for result in results)
+    # packet + both ends + one middle site, then the whole packet is blamed
+    assert len(calls) == 4
+
+
+def test_packet_with_bad_sites_at_both_ends(monkeypatch):
+    results, calls = _fetch(monkeypatch, 10, {0.0, 9.0})
+    assert isinstance(results[0], httpx.HTTPStatusError)
+    assert isinstance(results[9], httpx.HTTPStatusError)
+    assert [result["latitude"] for result in results[1:9]] == [float(i) for i in range(1, 9)]
+
+
+def test_two_site_packet_with_both_sites_bad(monkeypatch):
+    results, calls = _fetch(monkeypatch, 2, {0.0, 1.0})
+    assert all(isinstance(result, httpx.HTTPStatusError) for result in results)
+    assert len(calls) == 3
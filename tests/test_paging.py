@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+
+import server
+
+
+@pytest.fixture
+def pages(monkeypatch):
+    fetched = []
+
+    async def fetch_history_page(coord, start, end, key, param_vars):
+        fetched.append((start.isoformat(), end.isoformat()))
+        return {"latitude": coord.latitude, "longitude": coord.longitude, key: {"time": []}}
+
+    monkeypatch.setattr(server, "fetch_history_page", fetch_history_page)
+    return fetched
+
+
+def _walk(start_date, end_date, page_months):
+    """
+    Follow next_cursor from the first page to the last; returns the page ranges reported by the tool.
+    """
+    reported, cursor = [], None
+    while True:
+        result = asyncio.run(server.get_history_page(
+            latitude=50.0, longitude=14.0, start_date=start_date, end_date=end_date,
+            cursor=cursor, page_months=page_months
+        ))
+        assert result["status"] == "success", result
+        page = result["page"]
+        reported.append((page["start_date"], page["end_date"]))
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return reported
+
+
+def test_pages_follow_calendar_months(pages):
+    expected = [
+        ("2023-01-15", "2023-01-31"), ("2023-02-01", "2023-02-28"), ("2023-03-01", "2023-03-31"), ("2023-04-01", "2023-04-10")
+    ]
+    assert _walk("2023-01-15", "2023-04-10", 1) == expected
+    # Each page fetches exactly the range it reports
+    assert pages == expected
+
+
+def test_multi_month_pages_and_leap_february(pages):
+    assert _walk("2023-12-31", "2024-03-01", 2) == [("2023-12-31", "2024-01-31"), ("2024-02-01", "2024-03-01")]
+    assert _walk("2024-01-31", "2024-02-29", 1) == [("2024-01-31", "2024-01-31"), ("2024-02-01", "2024-02-29")]
+
+
+def test_single_page_has_no_cursor(pages):
+    assert _walk("2023-05-03", "2023-05-03", 1) == [("2023-05-03", "2023-05-03")]
+
+
+@pytest.mark.parametrize("cursor, page_months", [("2023-01-14", 1), ("2023-04-11", 1), ("2023-02-01", 0), ("2023-02-01", 13)])
+def test_invalid_cursor_or_page_size(pages, cursor, page_months):
+    result = asyncio.run(server.get_history_page(
+        latitude=50.0, longitude=14.0, start_date="2023-01-15", end_date="2023-04-10",
+        cursor=cursor, page_months=page_months
+    ))
+    assert result["status"] == "error"
+    assert pages == []
@@ -0,0 +1,98 @@
+import asyncio
+import math
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pytest
+
+import server
+
+COORD = server.Coordinate(latitude=50.0, longitude=14.0)
+VARIABLES = "temperature_2m,precipitation"
+REDUCERS = ["mean", "min", "max", "sum", "count"]
+
+
+def _hourly(start, end):
+    """
+    Deterministic archive-like payload for start..end, with gaps (None) in both variables.
+    """
+    hours = int((end - start).days + 1) * 24
+    first = datetime(start.year, start.month, start.day)
+    offset = int((first - datetime(2023, 1, 1)).total_seconds() // 3600)
+    times, temperature, precipitation = [], [], []
+    for hour in range(hours):
+        i = offset + hour
+        times.append((first + timedelta(hours=hour)).strftime("%Y-%m-%dT%H:%M"))
+        temperature.append(None if i % 7 == 0 else round(10 * math.sin(i / 24) + i % 5, 3))
+        precipitation.append(None if i % 11 == 0 else float(i % 3))
+    return {
+        "latitude": 50.0, "longitude": 14.0, "utc_offset_seconds": 0,
+        "hourly_units": {"time": "iso8601", "temperature_2m": "°C", "precipitation": "mm"},
+        "hourly": {"time": times, "temperature_2m": temperature, "precipitation": precipitation},
+    }
+
+
+@pytest.fixture
+def archive(monkeypatch):
+    fetched = []
+
+    async def fetch_history_chunked(coord, start, end, key, param_vars):
+        fetched.append((start, end))
+        return _hourly(start, end)
+
+    monkeypatch.setattr(server, "fetch_history_chunked", fetch_history_chunked)
+    monkeypatch.setattr(server, "AGGREGATE_CACHE", server.ResponseCache(max_entries=1000))
+    return fetched
+
+
+def _assert_same_block(actual, expected):
+    assert actual["time"] == expected["time"]
+    assert set(actual) == set(expected)
+    for name, column in expected.items():
+        if name != "time":
+            np.testing.assert_allclose(
+                np.array(actual[name], dtype=float), np.array(column, dtype=float), rtol=1e-9, equal_nan=True
+            )
+
+
+@pytest.mark.parametrize("resample", ["1w", "5d", "1M", "6h"])
+def test_month_partials_match_direct_resample(archive, resample):
+    count, unit, reducers = server.parse_resample(resample, ",".join(REDUCERS))
+    start, end = date(2023, 1, 20), date(2023, 3, 10)
+    merged = asyncio.run(server.fetch_history_resampled(COORD, start, end, "hourly", VARIABLES, count, unit, reducers))
+    direct = server.resample_payload(_hourly(start, end), count, unit, reducers)
+    _assert_same_block(merged["hourly"], direct["hourly"])
+    assert merged["hourly_units"] == direct["hourly_units"]
+
+
+def test_cached_month_partials_are_reused_across_requests(archive):
+    count, unit, reducers = server.parse_resample("1w", ",".join(REDUCERS))
+    asyncio.run(server.fetch_history_resampled(
+        COORD, date(2023, 1, 20), date(2023, 3, 10), "hourly", VARIABLES, count, unit, reducers
+    ))
+    archive.clear()
+    start, end = date(2023, 2, 1), date(2023, 3, 31)
+    merged = asyncio.run(server.fetch_history_resampled(COORD, start, end, "hourly", VARIABLES, count, unit, reducers))
+    # February is whole in both requests and comes from AGGREGATE_CACHE; only March is fetched again
+    assert archive == [(date(2023, 3, 1), date(2023, 3, 31))]
+    _assert_same_block(merged["hourly"], server.resample_payload(_hourly(start, end), count, unit, reducers)["hourly"])
+
+
+def test_merge_partials_joins_a_bucket_split_between_ranges():
+    times = [f"2023-01-31T{hour:02d}:00" for hour in range(20, 24)] + [f"2023-02-01T{hour:02d}:00" for hour in range(4)]
+    values = np.array([1.0, np.nan, 3.0, 4.0, 5.0, 6.0, np.nan, 8.0])
+    ids = server.bucket_ids(times, 12, "h")
+    merged = server.merge_partials([
+        server.partial_aggregates(ids[:4], values[:4]), server.partial_aggregates(ids[4:], values[4:])
+    ])
+    direct = server.partial_aggregates(ids, values)
+    for name in ("ids", "sum", "count", "min", "max"):
+        np.testing.assert_array_equal(merged[name], direct[name])
+
+
+def test_bucket_percentiles_ignore_nans():
+    ids = np.array([0, 0, 0, 0, 1, 1, 2])
+    values = np.array([4.0, np.nan, 1.0, 2.0, 5.0, 7.0, np.nan])
+    p50, p100 = server.bucket_percentiles(ids, values, [50.0, 100.0])
+    np.testing.assert_allclose(p50, [2.0, 6.0, np.nan], equal_nan=True)
+    np.testing.assert_allclose(p100, [4.0, 7.0, np.nan], equal_nan=True)
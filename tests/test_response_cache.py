@@ -0,0 +1,97 @@
+import asyncio
+import time
+
+import pytest
+
+import server
+
+URL = "http://upstream.test/v1/forecast"
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [time.time()]
+    monkeypatch.setattr(server.time, "time", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    calls = []
+
+    async def fetch_upstream(url, params, count_key):
+        calls.append(params)
+        await asyncio.sleep(0.01)
+        return {"latitude": params["latitude"], "version": len(calls)}
+
+    monkeypatch.setattr(server, "_fetch_upstream", fetch_upstream)
+    monkeypatch.setattr(server, "RESPONSE_CACHE", server.ResponseCache())
+    return calls
+
+
+def test_entries_expire_after_their_ttl(clock):
+    cache = server.ResponseCache()
+    cache.put("short", {"a": 1}, 10)
+    cache.put("forever", {"b": 2}, float("inf"))
+    assert cache.get("short") == ({"a": 1}, True)
+    clock[0] += 11
+    assert cache.get("short") == (None, False)
+    assert cache.get("forever") == ({"b": 2}, True)
+
+
+def test_expired_entries_are_served_stale_within_max_stale(clock):
+    cache = server.ResponseCache()
+    cache.put("key", {"a": 1}, 10)
+    clock[0] += 30
+    assert cache.get("key", max_stale=60) == ({"a": 1}, False)
+    clock[0] += 60
+    assert cache.get("key", max_stale=60) == (None, False)
+    assert len(cache) == 0
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = server.ResponseCache(max_entries=2)
+    cache.put("a", 1, 60)
+    cache.put("b", 2, 60)
+    cache.get("a")
+    cache.put("c", 3, 60)
+    assert cache.get("b") == (None, False)
+    assert cache.get("a") == (1, True)
+
+
+def test_shared_tier_is_visible_to_other_workers(tmp_path):
+    path = str(tmp_path / "responses.sqlite3")
+    writer, reader = server.ResponseCache(path=path), server.ResponseCache(path=path)
+    asyncio.run(writer.aput("key", {"a": 1}, 60))
+    assert reader.get("key") == (None, False)
+    assert asyncio.run(reader.aget("key")) == ({"a": 1}, True)
+    writer.close()
+    reader.close()
+
+
+def test_concurrent_identical_requests_share_one_upstream_call(upstream):
+    async def run():
+        return await asyncio.gather(*(server.fetch_json(URL, {"latitude": 50.0}, "forecast", 60) for _ in range(5)))
+
+    results = asyncio.run(run())
+    assert len(upstream) == 1
+    assert all(result is results[0] for result in results)
+    # Later calls are answered from the cache
+    asyncio.run(server.fetch_json(URL, {"latitude": 50.0}, "forecast", 60))
+    assert len(upstream) == 1
+    assert not server._INFLIGHT
+
+
+def test_stale_entry_is_returned_and_refreshed_in_background(upstream, clock):
+    async def run():
+        first = await server.fetch_json(URL, {"latitude": 50.0}, "forecast", 10, stale_while_revalidate=True)
+        clock[0] += 20
+        stale = await server.fetch_json(URL, {"latitude": 50.0}, "forecast", 10, stale_while_revalidate=True)
+        await asyncio.gather(*server._BACKGROUND_TASKS)
+        refreshed = await server.fetch_json(URL, {"latitude": 50.0}, "forecast", 10, stale_while_revalidate=True)
+        return first, stale, refreshed
+
+    first, stale, refreshed = asyncio.run(run())
+    assert stale is first
+    assert refreshed["version"] == 2
+    assert len(upstream) == 2
@@ -0,0 +1,68 @@
+import asyncio
+
+import server
+
+
+def _run_requests(scheduler, url, count, hold):
+    order, peak = [], [0, 0]
+
+    async def request(index):
+        async with scheduler.slot(url):
+            order.append(index)
+            peak[0] += 1
+            peak[1] = max(peak[1], peak[0])
+            await asyncio.sleep(hold)
+            peak[0] -= 1
+
+    async def run():
+        tasks = []
+        for index in range(count):
+            tasks.append(asyncio.ensure_future(request(index)))
+            # Let each request reach the queue before the next one arrives
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+    return order, peak[1]
+
+
+async def _timed(scheduler):
+    loop = asyncio.get_running_loop()
+    begin = loop.time()
+    started = []
+
+    async def request(index):
+        async with scheduler.slot("http://upstream.test/"):
+            started.append((index, loop.time() - begin))
+
+    tasks = []
+    for index in range(6):
+        tasks.append(asyncio.ensure_future(request(index)))
+        await asyncio.sleep(0)
+    await asyncio.gather(*tasks)
+    return started
+
+
+def test_in_flight_cap_and_fifo_admission():
+    scheduler = server.RequestScheduler(limits={"upstream.test": (10_000.0, 100, 3)})
+    order, peak = _run_requests(scheduler, "http://upstream.test/v1/forecast", 12, 0.01)
+    assert peak == 3
+    assert order == list(range(12))
+    stats = scheduler.stats()["upstream.test"]
+    assert stats["in_flight"] == 0
+    assert stats["max_queue_depth"] >= 9
+
+
+def test_token_bucket_admits_in_order_at_the_rate():
+    scheduler = server.RequestScheduler(limits={"upstream.test": (50.0, 2, 10)})
+    started = asyncio.run(_timed(scheduler))
+    assert [index for index, _ in started] == list(range(6))
+    # Two from the burst right away, then one every 1/50 s
+    assert started[-1][1] >= 4 / 50 * 0.8
+
+
+def test_unlisted_hosts_use_default_limits():
+    scheduler = server.RequestScheduler(limits={}, default_limits=(10_000.0, 100, 2))
+    _, peak = _run_requests(scheduler, "other.test", 6, 0.01)
+    assert peak == 2
+
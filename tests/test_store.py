@@ -0,0 +1,62 @@
+from datetime import date, timedelta
+
+import pytest
+
+import server
+
+COORD = server.Coordinate(latitude=50.0, longitude=14.0)
+
+
+def _payload(start, end, variables):
+    days = [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+    block = {"time": [day.isoformat() for day in days]}
+    block.update({variable: [float(day.day) for day in days] for variable in variables})
+    return {
+        "latitude": 50.0, "longitude": 14.0, "generationtime_ms": 1.0,
+        "daily_units": {"time": "iso8601", **{variable: "mm" for variable in variables}}, "daily": block,
+    }
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = server.WeatherStore(path=str(tmp_path / "store.sqlite3"))
+    yield store
+    store.close()
+
+
+def test_read_requires_every_variable_covered(store):
+    store.write_range(COORD, "daily", date(2023, 3, 1), date(2023, 3, 20), _payload(date(2023, 3, 1), date(2023, 3, 20), ["rain"]))
+    data = store.read_range(COORD, "daily", ["rain"], date(2023, 3, 5), date(2023, 3, 6))
+    assert data["daily"] == {"time": ["2023-03-05", "2023-03-06"], "rain": [5.0, 6.0]}
+    assert store.read_range(COORD, "daily", ["rain", "snowfall"], date(2023, 3, 5), date(2023, 3, 6)) is None
+    assert store.read_range(COORD, "daily", ["rain"], date(2023, 3, 15), date(2023, 3, 25)) is None
+
+
+def test_shorter_write_does_not_shrink_coverage(store):
+    store.write_range(COORD, "daily", date(2023, 3, 1), date(2023, 3, 20),
+                      _payload(date(2023, 3, 1), date(2023, 3, 20), ["temperature_2m_max"]))
+    store.write_range(COORD, "daily", date(2023, 3, 1), date(2023, 3, 5),
+                      _payload(date(2023, 3, 1), date(2023, 3, 5), ["temperature_2m_max", "rain"]))
+    data = store.read_range(COORD, "daily", ["temperature_2m_max"], date(2023, 3, 1), date(2023, 3, 20))
+    assert data is not None
+    assert len(data["daily"]["time"]) == 20
+    assert store.read_range(COORD, "daily", ["rain"], date(2023, 3, 1), date(2023, 3, 5)) is not None
+
+
+def test_units_are_limited_to_requested_variables(store):
+    store.write_range(COORD, "daily", date(2023, 3, 1), date(2023, 3, 2),
+                      _payload(date(2023, 3, 1), date(2023, 3, 2), ["rain", "snowfall"]))
+    data = store.read_range(COORD, "daily", ["rain"], date(2023, 3, 1), date(2023, 3, 2))
+    assert data["daily_units"] == {"time": "iso8601", "rain": "mm"}
+    assert "generationtime_ms" not in data
+
+
+def test_partial_month_write_merges_with_stored_month(store):
+    store.write_range(COORD, "daily", date(2023, 3, 1), date(2023, 4, 10),
+                      _payload(date(2023, 3, 1), date(2023, 4, 10), ["rain"]))
+    revised = _payload(date(2023, 3, 30), date(2023, 4, 2), ["rain"])
+    revised["daily"]["rain"] = [0.0] * 4
+    store.write_range(COORD, "daily", date(2023, 3, 30), date(2023, 4, 2), revised)
+    data = store.read_range(COORD, "daily", ["rain"], date(2023, 3, 1), date(2023, 4, 10))
+    assert data["daily"]["time"] == [(date(2023, 3, 1) + timedelta(days=offset)).isoformat() for offset in range(41)]
+    assert data["daily"]["rain"] == [float(day) for day in range(1, 30)] + [0.0] * 4 + [float(day) for day in range(3, 11)]